@@ -0,0 +1,262 @@
+import os
+import json
+import time
+import random
+import argparse
+import subprocess
+import tempfile
+import numpy as np
+import chromadb
+import retriever
+from retriever import ChromaRetriever, embed_texts, embed_query, query_cache, collection_metadata
+from vector_store import store_chunks, chunk_id
+from lexical_index import LexicalIndex
+from binary_index import BinaryIndex
+from video_index import build_video_index
+from reranker import build_reranker
+
+benchmarks_dir = "../data/benchmarks"
+MODES = ["similarity", "hybrid", "mmr", "compressed", "coarse"]
+
+TOPICS = [
+    "kubernetes", "pytorch", "gradient descent", "postgres", "react hooks", "rust ownership",
+    "docker layers", "graph neural networks", "redis streams", "terraform modules",
+    "tokenizers", "attention heads", "kafka partitions", "numpy broadcasting", "css grid",
+    "load balancers", "webassembly", "garbage collection", "feature flags", "unit testing"
+]
+COMPONENTS = [
+    "scheduler", "cache", "optimizer", "planner", "indexer", "router", "encoder", "allocator",
+    "compiler", "profiler", "gateway", "replica", "serializer", "pipeline", "sampler", "validator"
+]
+CODENAMES = [
+    "amber", "basalt", "cobalt", "delta", "ember", "falcon", "granite", "harbor", "iris", "juniper",
+    "krypton", "lumen", "meridian", "nimbus", "onyx", "pioneer", "quartz", "raven", "sierra", "tundra"
+]
+TEAMS = ["platform", "search", "billing", "mobile", "infra", "data", "payments", "growth", "security", "analytics"]
+METRICS = ["latency", "memory use", "build time", "error rate", "cold starts", "disk usage", "cost"]
+# Every chunk gets its own (team, codename, component) triple
+MAX_CHUNKS = len(TEAMS) * len(CODENAMES) * len(COMPONENTS)
+FILLER = [
+    "So let's take a quick look at the next slide.",
+    "Okay, that part is pretty important, so keep it in mind.",
+    "If you have questions, drop them in the comments.",
+    "Let me switch over to the terminal for a second.",
+    "Alright, moving on.",
+    "This is something a lot of people get wrong at first.",
+    "We will come back to this later in the video.",
+]
+
+
+def synthetic_corpus(videos=20, chunks_per_video=30, seed=0):
+    """Deterministic transcript chunks and questions that each have exactly one answering chunk.
+
+    Every chunk states one fact about a unique (team, codename, component)
+    triple between filler sentences, and its question asks for that fact in other
+    words. Returns (chunks, questions), questions as
+    {"question": ..., "chunk_id": ..., "file_name": ...}.
+    """
+    rng = random.Random(seed)
+    if videos * chunks_per_video > MAX_CHUNKS:
+        raise ValueError(f"At most {MAX_CHUNKS} chunks can get a unique fact")
+    triples = [(team, codename, component) for team in TEAMS for codename in CODENAMES for component in COMPONENTS]
+    rng.shuffle(triples)
+
+    chunks, questions = [], []
+    for v in range(videos):
+        topic = TOPICS[v % len(TOPICS)]
+        file_name = f"synthetic_{v:03d}_{topic.replace(' ', '_')}.mp4"
+        for c in range(chunks_per_video):
+            team, codename, component = triples[v * chunks_per_video + c]
+            metric = rng.choice(METRICS)
+            percent = rng.randint(5, 95)
+            version = f"{rng.randint(1, 9)}.{rng.randint(0, 20)}"
+            fact = (f"With {topic}, the {team} team's {codename} {component} in version {version} "
+                    f"cut {metric} by {percent} percent.")
+            sentences = rng.sample(FILLER, 2)
+            sentences.insert(rng.randint(0, 2), fact)
+            start_time = c * 30.0
+            chunk = {
+                "text": " ".join(sentences),
+                "start_time": start_time,
+                "end_time": start_time + 32.0,
+                "file_name": file_name
+            }
+            chunks.append(chunk)
+            questions.append({
+                "question": f"How much did the {codename} {component} of the {team} team improve {metric}?",
+                "chunk_id": chunk_id(chunk),
+                "file_name": file_name
+            })
+    return chunks, questions
+
+
+def latency_stats(seconds):
+    ms = np.asarray(seconds) * 1000
+    total = float(np.sum(seconds))
+    return {
+        "count": len(ms),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "per_second": len(ms) / total if total else 0.0
+    }
+
+
+def ranking_metrics(results, questions, k):
+    """recall@k and MRR of the labeled chunk; merged hits count for each of their members."""
+    recall, reciprocal_ranks = 0, []
+    for hits, question in zip(results, questions):
+        rank = next(
+            (i for i, hit in enumerate(hits[:k], 1)
+             if question["chunk_id"] in (hit.get("merged_ids") or [hit.get("id")])),
+            None
+        )
+        recall += rank is not None
+        reciprocal_ranks.append(1.0 / rank if rank else 0.0)
+    return {f"recall@{k}": recall / len(questions), "mrr": float(np.mean(reciprocal_ranks))}
+
+
+def timed(function, items):
+    results, seconds = [], []
+    for item in items:
+        start = time.perf_counter()
+        results.append(function(item))
+        seconds.append(time.perf_counter() - start)
+    return results, seconds
+
+
+def ingest(chunks, data_dir):
+    """Run the vector_store.py ingest steps into data_dir, returns {stage: stats}."""
+    stages = {}
+    texts = [chunk["text"] for chunk in chunks]
+    ids = [chunk_id(chunk) for chunk in chunks]
+
+    def stage(name, function):
+        start = time.perf_counter()
+        result = function()
+        seconds = time.perf_counter() - start
+        stages[name] = {"seconds": seconds, "chunks_per_second": len(chunks) / seconds if seconds else 0.0}
+        return result
+
+    embeddings = stage("embed", lambda: embed_texts(texts))
+    client = chromadb.PersistentClient(path=os.path.join(data_dir, "chroma_db"))
+    stage("vector_store", lambda: store_chunks(client, chunks, list(embeddings)))
+    stage("video_index", lambda: build_video_index(client, chunks, embeddings, collection_metadata))
+    stage("lexical_index", lambda: LexicalIndex(os.path.join(data_dir, "bm25")).add(ids, texts))
+    stage("binary_index", lambda: BinaryIndex(os.path.join(data_dir, "binary")).update(ids, embeddings))
+    return stages
+
+
+def run_benchmark(videos=20, chunks_per_video=30, k=5, seed=0, modes=MODES, batch_size=32):
+    chunks, questions = synthetic_corpus(videos, chunks_per_video, seed)
+    texts = [question["question"] for question in questions]
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {"videos": videos, "chunks_per_video": chunks_per_video, "questions": len(questions),
+                   "k": k, "seed": seed},
+        "ingest": {},
+        "query": {}
+    }
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        report["ingest"] = ingest(chunks, data_dir)
+        chroma = ChromaRetriever(
+            chroma_db_dir=os.path.join(data_dir, "chroma_db"),
+            lexical_dir=os.path.join(data_dir, "bm25"),
+            compressed_dir=os.path.join(data_dir, "binary"),
+            default_k=k
+        )
+        report["config"]["embedding_model"] = retriever.model_state
+
+        # Query embedding on its own, every search below then hits the warm query cache
+        query_cache.clear()
+        _, seconds = timed(embed_query, texts)
+        report["query"]["embed"] = latency_stats(seconds)
+
+        for mode in modes:
+            search = chroma.as_retriever(search_type=mode, search_kwargs={"k": k})
+            results, seconds = timed(search, texts)
+            report["query"][mode] = {**ranking_metrics(results, questions, k), **latency_stats(seconds)}
+
+        batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+        results, seconds = timed(lambda batch: chroma.batch_search(batch, k=k, search_type="hybrid"), batches)
+        report["query"]["batch_hybrid"] = {
+            **ranking_metrics([hits for batch in results for hits in batch], questions, k),
+            **latency_stats(seconds),
+            "queries_per_second": len(texts) / sum(seconds) if sum(seconds) else 0.0
+        }
+
+        reranker = build_reranker()
+        reranker.warmup()
+        candidates = [chroma.hybrid_search(text, k=reranker.fetch_k(k)) for text in texts]
+        results, seconds = timed(lambda item: reranker.rerank(item[0], item[1], k), list(zip(texts, candidates)))
+        report["query"]["rerank"] = {**ranking_metrics(results, questions, k), **latency_stats(seconds),
+                                     **reranker.stats()}
+        reranker.close()
+        chroma.close()
+    return report
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except Exception:
+        return None
+
+
+def save_report(report, output=None):
+    if output is None:
+        os.makedirs(benchmarks_dir, exist_ok=True)
+        output = os.path.join(benchmarks_dir, f"benchmark_{report['commit'] or 'nogit'}_{int(time.time())}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    return output
+
+
+def compare_reports(baseline, report):
+    """Print quality, latency and throughput of every query stage next to the baseline report."""
+    print(f"Comparing {report['commit']} against {baseline.get('commit')}")
+    for stage, metrics in report["query"].items():
+        before = baseline.get("query", {}).get(stage, {})
+        for name, value in metrics.items():
+            if name not in before or not (name.startswith(("recall@", "p50", "p95", "p99")) or
+                                          name in ("mrr", "per_second", "queries_per_second")):
+                continue
+            print(f"{stage:>14} {name:>18}: {before[name]:10.4f} -> {value:10.4f} ({value - before[name]:+.4f})")
+
+
+def print_report(report):
+    print(f"Embedding model: {report['config']['embedding_model']}")
+    for stage, stats in report["ingest"].items():
+        print(f"ingest {stage:>14}: {stats['seconds']:.3f}s ({stats['chunks_per_second']:.1f} chunks/s)")
+    k = report["config"]["k"]
+    for stage, stats in report["query"].items():
+        quality = f"recall@{k}={stats[f'recall@{k}']:.3f} mrr={stats['mrr']:.3f} " if "mrr" in stats else ""
+        print(f"query  {stage:>14}: {quality}p50={stats['p50_ms']:.2f}ms p95={stats['p95_ms']:.2f}ms "
+              f"p99={stats['p99_ms']:.2f}ms ({stats['per_second']:.1f}/s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline retrieval benchmark on a synthetic transcript corpus")
+    parser.add_argument("--videos", type=int, default=20)
+    parser.add_argument("--chunks-per-video", type=int, default=30)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--modes", nargs="+", default=MODES, choices=MODES)
+    parser.add_argument("--output", default=None, help="JSON report path (default: ../data/benchmarks/)")
+    parser.add_argument("--compare", default=None, help="Earlier JSON report to compare against")
+    args = parser.parse_args()
+    if args.videos < 1 or args.chunks_per_video < 1 or args.k < 1:
+        parser.error("--videos, --chunks-per-video and --k must be at least 1")
+    if args.videos * args.chunks_per_video > MAX_CHUNKS:
+        parser.error(f"--videos x --chunks-per-video must be at most {MAX_CHUNKS}")
+
+    report = run_benchmark(videos=args.videos, chunks_per_video=args.chunks_per_video, k=args.k,
+                           seed=args.seed, modes=args.modes)
+    print_report(report)
+    print(f"Saved report to {save_report(report, args.output)}")
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare_reports(json.load(f), report)
@@ -0,0 +1,212 @@
+import os
+import json
+import time
+import shutil
+import tempfile
+import argparse
+import threading
+import numpy as np
+
+binary_dir = "../data/db/binary"
+MANIFEST = "index.json"
+
+# Number of set bits in every byte value, for Hamming distances on packed codes
+POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.uint16)
+
+
+def normalize_rows(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
+
+
+def sign_codes(vectors, mean=0.0):
+    # One bit per dimension: 384-d float32 vectors become 48-byte codes. Signs are
+    # taken around the corpus mean, sentence embeddings share a large common component
+    return np.packbits((np.asarray(vectors) - mean) > 0, axis=-1)
+
+
+def hamming_distances(codes, query_code):
+    if hasattr(np, "bitwise_count") and codes.shape[1] % 8 == 0:
+        # Popcount 64 bits at a time (NumPy >= 2.0)
+        words = np.bitwise_xor(codes.view(np.uint64), query_code.view(np.uint64))
+        return np.bitwise_count(words).sum(axis=1, dtype=np.uint16)
+    return POPCOUNT[np.bitwise_xor(codes, query_code)].sum(axis=1)
+
+
+class BinaryIndex:
+    """Two-stage vector index: Hamming scan over sign codes, then exact rescoring.
+
+    Every chunk is stored as a packed sign code and as its full unit-length
+    vector, both memory-mapped. A query first ranks all codes by Hamming
+    distance, which touches 32x less memory than the full vectors, then
+    rescores only the best candidates by cosine similarity with their full
+    vectors. Each update writes a new generation directory and switches the
+    manifest to it, so readers always see a complete index.
+    """
+
+    def __init__(self, index_dir=binary_dir, candidates=500):
+        self.index_dir = index_dir
+        self.candidates = candidates
+        self.lock = threading.Lock()
+        self.ids = []
+        self.codes = None
+        self.vectors = None
+        self.mean = 0.0
+        # chunk id -> row, built on the first filtered search
+        self.rows = None
+        self.manifest_mtime = None
+        self.load()
+
+    def manifest_path(self):
+        return os.path.join(self.index_dir, MANIFEST)
+
+    def load(self):
+        path = self.manifest_path()
+        if not os.path.exists(path):
+            self.ids, self.codes, self.vectors, self.mean, self.manifest_mtime = [], None, None, 0.0, None
+            self.rows = None
+            return
+        with open(path, "r", encoding="utf-8") as f:
+            generation = os.path.join(self.index_dir, json.load(f)["generation"])
+        with open(os.path.join(generation, "ids.json"), "r", encoding="utf-8") as f:
+            self.ids = json.load(f)
+        self.codes = np.load(os.path.join(generation, "codes.npy"), mmap_mode="r")
+        self.vectors = np.load(os.path.join(generation, "vectors.npy"), mmap_mode="r")
+        self.mean = np.load(os.path.join(generation, "mean.npy"))
+        self.rows = None
+        self.manifest_mtime = os.path.getmtime(path)
+
+    def reload_if_changed(self):
+        path = self.manifest_path()
+        mtime = os.path.getmtime(path) if os.path.exists(path) else None
+        if mtime != self.manifest_mtime:
+            with self.lock:
+                self.load()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def write(self, ids, vectors):
+        generation = f"gen_{time.time_ns()}"
+        path = os.path.join(self.index_dir, generation)
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, "ids.json"), "w", encoding="utf-8") as f:
+            json.dump(ids, f)
+        mean = vectors.mean(axis=0)
+        np.save(os.path.join(path, "mean.npy"), mean)
+        np.save(os.path.join(path, "codes.npy"), sign_codes(vectors, mean))
+        np.save(os.path.join(path, "vectors.npy"), vectors)
+
+        tmp_path = self.manifest_path() + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"generation": generation, "dim": int(vectors.shape[1])}, f)
+        os.replace(tmp_path, self.manifest_path())
+        # Open memory maps of older generations stay valid after their files are unlinked
+        for name in os.listdir(self.index_dir):
+            if name.startswith("gen_") and name != generation:
+                shutil.rmtree(os.path.join(self.index_dir, name), ignore_errors=True)
+
+    def update(self, ids, embeddings):
+        """Insert or replace the vectors of the given chunk ids, returns the index size."""
+        if not len(ids):
+            return len(self.ids)
+        with self.lock:
+            rows = {chunk_id: i for i, chunk_id in enumerate(self.ids)}
+            new = dict(zip(ids, normalize_rows(embeddings)))
+            all_ids = list(self.ids) + [chunk_id for chunk_id in new if chunk_id not in rows]
+            vectors = np.empty((len(all_ids), len(next(iter(new.values())))), dtype=np.float32)
+            if self.vectors is not None and len(self.ids):
+                vectors[:len(self.ids)] = self.vectors
+            for i, chunk_id in enumerate(all_ids):
+                if chunk_id in new:
+                    vectors[i] = new[chunk_id]
+            os.makedirs(self.index_dir, exist_ok=True)
+            self.write(all_ids, vectors)
+            self.load()
+            return len(self.ids)
+
+    def rows_for(self, ids, chunk_ids):
+        rows = self.rows
+        if rows is None:
+            rows = self.rows = {chunk_id: row for row, chunk_id in enumerate(ids)}
+        return np.sort(np.fromiter((rows[c] for c in chunk_ids if c in rows), dtype=np.int64))
+
+    def search(self, query_embedding, k=10, candidates=None, allowed=None):
+        """Return [(chunk_id, cosine_similarity)] for the k best chunks.
+
+        allowed is an optional set of chunk ids; only their codes are scanned.
+        """
+        self.reload_if_changed()
+        codes, vectors, ids, mean = self.codes, self.vectors, self.ids, self.mean
+        if codes is None or not ids:
+            return []
+        rows = None
+        if allowed is not None:
+            rows = self.rows_for(ids, allowed)
+            if not len(rows):
+                return []
+            codes = codes[rows]
+        query = normalize_rows(query_embedding)
+        n_candidates = min(max(candidates or self.candidates, k), len(codes))
+
+        distances = hamming_distances(codes, sign_codes(query, mean))
+        if n_candidates < len(codes):
+            shortlist = np.argpartition(distances, n_candidates - 1)[:n_candidates]
+        else:
+            shortlist = np.arange(len(codes))
+        if rows is not None:
+            shortlist = rows[shortlist]
+        shortlist.sort()
+        scores = vectors[shortlist] @ query
+        best = np.argsort(-scores)[:k]
+        return [(ids[shortlist[i]], float(scores[i])) for i in best]
+
+
+def recall_benchmark(n=100000, dim=384, queries=200, k=10, candidates=(50, 100, 200, 500, 1000), clusters=256,
+                     noise=0.15, seed=0):
+    """Compare BinaryIndex.search against exact search on clustered random vectors.
+
+    Returns one dict per candidate count with recall@k and mean query latency
+    in milliseconds, plus the exact full-vector scan latency for reference.
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = normalize_rows(centers[rng.integers(clusters, size=n)] + noise * rng.standard_normal((n, dim)).astype(np.float32))
+    picked = rng.integers(n, size=queries)
+    query_vectors = normalize_rows(vectors[picked] + noise * rng.standard_normal((queries, dim)).astype(np.float32))
+
+    start = time.perf_counter()
+    truth = []
+    for query in query_vectors:
+        scores = vectors @ query
+        truth.append({str(i) for i in np.argpartition(-scores, k - 1)[:k]})
+    exact_ms = (time.perf_counter() - start) * 1000 / queries
+
+    results = []
+    with tempfile.TemporaryDirectory() as index_dir:
+        index = BinaryIndex(index_dir)
+        index.update([str(i) for i in range(n)], vectors)
+        for n_candidates in candidates:
+            hits = 0
+            start = time.perf_counter()
+            for query, expected in zip(query_vectors, truth):
+                found = index.search(query, k, candidates=n_candidates)
+                hits += len(expected.intersection(chunk_id for chunk_id, _ in found))
+            results.append({
+                "candidates": n_candidates,
+                f"recall@{k}": hits / (queries * k),
+                "latency_ms": (time.perf_counter() - start) * 1000 / queries,
+                "exact_latency_ms": exact_ms
+            })
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall and latency of binary-code search against exact search")
+    parser.add_argument("--n", type=int, default=100000, help="Number of synthetic vectors")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--noise", type=float, default=0.15, help="Spread of vectors around their cluster centers")
+    args = parser.parse_args()
+    for row in recall_benchmark(n=args.n, queries=args.queries, k=args.k, noise=args.noise):
+        print(json.dumps(row))
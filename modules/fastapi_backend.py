@@ -1,26 +1,27 @@
 import os
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends, Request
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
+from typing import Optional
 from dotenv import load_dotenv
-from retriever import ChromaRetriever
-from groq import Groq
-import re
+from retriever import ChromaRetriever, warmup
+from llm_client import get_llm_client, close_llm_client
+from streaming import strip_think
+from prompt_builder import build_prompt_builder
+from session_store import build_session_store
 
 load_dotenv()
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+prompt_builder = build_prompt_builder()
+session_store = build_session_store()
 
 
-def get_llm_response(context, question, chat_history):
-    client = Groq(api_key=GROQ_API_KEY)
+async def get_llm_response(context, question, chat_history):
     model_name = "deepseek-r1-distill-llama-70b"
 
-    history_str = ""
-    for msg in chat_history:
-        if msg["role"] == "user":
-            history_str += f"User: {msg['content']}\n"
-        else:
-            history_str += f"Assistant: {msg['content']}\n"
+    history_str = prompt_builder.build_history(chat_history, context, question)
     # history_str = ""
     # for msg in chat_history:
     #     role = "User" if msg["role"] == "user" else "Assistant"
@@ -44,25 +45,51 @@ def get_llm_response(context, question, chat_history):
         },
     ]
 
-    chat_completion = client.chat.completions.create(
+    chat_completion = await get_llm_client().complete(
         messages=messages,
         model=model_name,
     )
-    answer = chat_completion.choices[0].message.content.strip()
-    answer = re.sub(r"<think>.*?</think>", "", answer, flags=re.DOTALL).strip()
+    answer = strip_think(chat_completion.choices[0].message.content)
     return answer
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app):
+    app.state.retriever = ChromaRetriever()
+    # Load the embedding model off the startup path so the server accepts connections right away
+    warmup(background=True)
+    yield
+    app.state.retriever.close()
+    await close_llm_client()
+
+def get_retriever(request: Request) -> ChromaRetriever:
+    return request.app.state.retriever
+
+app = FastAPI(lifespan=lifespan)
 
 class QueryRequest(BaseModel):
     query: str
     chat_history: list = []
+    session_id: Optional[str] = None
+
+@app.get("/")
+async def health_check(retriever: ChromaRetriever = Depends(get_retriever)):
+    retriever_status = retriever.health()
+    return {
+        "status": "ok" if retriever_status["connected"] else "degraded",
+        "retriever": retriever_status,
+        "sessions": session_store.stats()
+    }
+
+@app.delete("/session/{session_id}")
+async def delete_session(session_id: str):
+    return {"session_id": session_id, "deleted": session_store.delete(session_id)}
 
 @app.post("/query")
-async def query_endpoint(request: QueryRequest):
+async def query_endpoint(request: QueryRequest, retriever: ChromaRetriever = Depends(get_retriever)):
     TOP_K = 3
-    retriever_chain = ChromaRetriever().as_retriever(search_kwargs={"k": TOP_K})
-    top_chunks = retriever_chain(request.query, k=TOP_K)
+    retriever_chain = retriever.as_retriever(search_kwargs={"k": TOP_K})
+    # Retrieval is CPU bound, keep it off the event loop
+    top_chunks = await asyncio.to_thread(retriever_chain, request.query, k=TOP_K)
     non_empty_chunks = [chunk for chunk in top_chunks if chunk["text"].strip()]
     if not non_empty_chunks:
         return JSONResponse(content={
@@ -76,7 +103,16 @@ async def query_endpoint(request: QueryRequest):
         f"{top_chunk['text']} "
         f"(File: {top_chunk['file_name']}, Start: {top_chunk['start_time']}s, End: {top_chunk['end_time']}s)"
     )
-    answer = get_llm_response(context, request.query, request.chat_history)
+    chat_history = request.chat_history
+    if request.session_id:
+        chat_history = session_store.get(request.session_id) or request.chat_history
+    answer = await get_llm_response(context, request.query, chat_history)
+    if request.session_id:
+        session_store.append(
+            request.session_id,
+            {"role": "user", "content": request.query},
+            {"role": "assistant", "content": answer}
+        )
 
     chunk_payload = [
         {
@@ -1,5 +1,6 @@
 import os
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Depends, Request
 from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
@@ -7,16 +8,23 @@ from dotenv import load_dotenv
 import pyngrok.ngrok as ngrok
 import uvicorn
 import sys
-import re
 import asyncio
 import json
 from fastapi.responses import FileResponse
 from pathlib import Path
+from typing import Optional, List
 
 
 # Import your existing modules
-from retriever import ChromaRetriever
-from groq import Groq
+from retriever import ChromaRetriever, warmup, embed_query, embed_queries, adaptive_cutoff, multi_query_types
+from response_cache import SemanticCache
+from query_router import build_router, OVERVIEW_PATTERN
+from reranker import build_reranker
+from stitching import stitch_chunks
+from llm_client import get_llm_client, close_llm_client, llm_client_stats
+from streaming import sse_event, coalesce_tokens, stream_message, filter_think, strip_think
+from prompt_builder import build_prompt_builder
+from session_store import build_session_store
 
 
 # VIDEO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data/videos")
@@ -25,7 +33,61 @@ from groq import Groq
 # Load environment variables
 load_dotenv()
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+# "hybrid" fuses BM25 and vector search, "similarity" is vector search only and
+# "mmr" is vector search diversified so near-duplicate chunks do not fill the context
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.5"))
+MMR_DUPLICATE_THRESHOLD = float(os.getenv("MMR_DUPLICATE_THRESHOLD", "0.95"))
+# Retrieved chunks of one video that overlap or are at most STITCH_MAX_GAP seconds
+# apart are sent as one passage; STITCH_CHUNKS=0 sends them separately
+STITCH_CHUNKS = os.getenv("STITCH_CHUNKS", "1") == "1"
+STITCH_MAX_GAP = float(os.getenv("STITCH_MAX_GAP", "1.0"))
+# Candidates below MIN_SIMILARITY (cosine) are dropped, and the list is cut at the
+# first similarity drop larger than SCORE_GAP. When nothing is left the query gets
+# the "Not found" answer without an LLM call. Set either to an empty string to turn
+# it off; both only apply once the index is in cosine space (retriever.calibrated).
+def optional_float(name, default):
+    value = os.getenv(name, default)
+    return float(value) if value else None
+
+MIN_SIMILARITY = optional_float("MIN_SIMILARITY", "0.2")
+SCORE_GAP = optional_float("SCORE_GAP", "0.15")
 NGROK_AUTH_TOKEN = os.getenv("NGROK_AUTH_TOKEN")
+# Streamed tokens are grouped into frames of up to STREAM_MAX_CHARS characters or
+# STREAM_MAX_DELAY seconds; STREAM_MAX_DELAY=0 sends every token as its own frame
+STREAM_MAX_DELAY = float(os.getenv("STREAM_MAX_DELAY", "0.03"))
+STREAM_MAX_CHARS = int(os.getenv("STREAM_MAX_CHARS", "64"))
+
+# Routes greetings, unsafe requests and video questions locally, calling
+# route_query (the LLM classifier) only when the local router is unsure
+local_router = build_router()
+
+# Keeps each prompt within PROMPT_MAX_TOKENS: retrieved context is capped and
+# older chat turns are compacted into a cached rolling summary
+prompt_builder = build_prompt_builder()
+
+# Chat history for clients that send a session_id instead of the full history
+session_store = build_session_store()
+
+# Retrieval fetches RERANK_CANDIDATES hits and a cross-encoder keeps the best TOP_K,
+# falling back to retrieval order when it takes longer than RERANK_BUDGET seconds
+reranker = build_reranker()
+
+LLM_ERROR_MESSAGE = "Sorry, I encountered an error processing your request."
+UNSAFE_MESSAGE = "I'm sorry, but I cannot provide information or assistance with that request. Please ask a different question that I can help with."
+
+TOP_K = 3
+# /query/batch limits: queries per request and LLM calls in flight per batch, so one
+# large offline job cannot take every slot of the shared LLM client
+BATCH_MAX_QUERIES = int(os.getenv("BATCH_MAX_QUERIES", "1000"))
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "8"))
+
+# Answers replayed for paraphrased questions that retrieve the same chunks
+answer_cache = SemanticCache(
+    threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.9")),
+    maxsize=int(os.getenv("SEMANTIC_CACHE_SIZE", "512")),
+    ttl=float(os.getenv("SEMANTIC_CACHE_TTL", "86400"))
+)
 
 if not GROQ_API_KEY:
     print("WARNING: GROQ_API_KEY is not set in your .env file. The application may not work correctly.")
@@ -35,8 +97,24 @@ if not NGROK_AUTH_TOKEN:
 else:
     ngrok.set_auth_token(NGROK_AUTH_TOKEN)
 
+@asynccontextmanager
+async def lifespan(app):
+    # One retriever per process: the Chroma client, collection handles and the
+    # embedding model are created once here and shared by every request
+    app.state.retriever = ChromaRetriever()
+    # Load the embedding model off the startup path so the server accepts connections right away
+    warmup(background=True)
+    local_router.warmup(background=True)
+    reranker.warmup(background=True)
+    yield
+    app.state.retriever.close()
+    await close_llm_client()
+
+def get_retriever(request: Request) -> ChromaRetriever:
+    return request.app.state.retriever
+
 # Create FastAPI app
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Add CORS middleware to allow requests from Streamlit Cloud
 app.add_middleware(
@@ -51,9 +129,8 @@ app.add_middleware(
 class Route(BaseModel):
     destination: str = Field(..., description="Destination to route to")
 
-def route_query(query: str) -> str:
+async def route_query(query: str) -> str:
     
-    client = Groq(api_key=GROQ_API_KEY)
     model_name = "qwen-qwq-32b" 
 
     messages = [
@@ -79,12 +156,11 @@ def route_query(query: str) -> str:
     ]
 
     try:
-        chat_completion = client.chat.completions.create(
+        chat_completion = await get_llm_client().complete(
             model=model_name,
             messages=messages
         )
-        classification = chat_completion.choices[0].message.content.strip().upper()
-        classification = re.sub(r"<THINK>.*?</THINK>", "", classification, flags=re.DOTALL).strip()
+        classification = strip_think(chat_completion.choices[0].message.content).upper()
         print(f"LLM classification: {classification}")
 
         if classification not in {"DEFAULT", "UNSAFE", "BOT"}:
@@ -96,19 +172,15 @@ def route_query(query: str) -> str:
         print(f"Error classifying query: {str(e)}")
         return "Bot"
 
-async def stream_llm_response(context, question, chat_history=""):
-    client = Groq(api_key=GROQ_API_KEY)
+async def llm_tokens(messages, model_name):
+    async for chunk in get_llm_client().stream(messages=messages, model=model_name):
+        if hasattr(chunk.choices[0].delta, 'content') and chunk.choices[0].delta.content is not None:
+            yield chunk.choices[0].delta.content
+
+async def stream_llm_response(context, question, chat_history="", on_complete=None):
     model_name = "deepseek-r1-distill-llama-70b"
 
-    history_str = ""
-    if isinstance(chat_history, list):
-        for msg in chat_history:
-            if msg.get("role") == "user":
-                history_str += f"User: {msg.get('content', '')}\n"
-            else:
-                history_str += f"Assistant: {msg.get('content', '')}\n"
-    else:
-        history_str = chat_history
+    history_str = prompt_builder.build_history(chat_history, context, question)
     
     messages = [
         {
@@ -132,43 +204,26 @@ async def stream_llm_response(context, question, chat_history=""):
     ]
 
     try:
-        stream = client.chat.completions.create(
-            messages=messages,
-            model=model_name,
-            stream=True,
-        )
-        
-        complete_response = ""
-        for chunk in stream:
-            if hasattr(chunk.choices[0].delta, 'content') and chunk.choices[0].delta.content is not None:
-                token = chunk.choices[0].delta.content
-                complete_response += token
-                token = re.sub(r"<think>.*?</think>", "", token, flags=re.DOTALL).strip()
-                if token:
-                    yield f"data: {json.dumps({'token': token})}\n\n"
-                    await asyncio.sleep(0.01) 
+        visible = []
+        tokens = filter_think(llm_tokens(messages, model_name))
+        async for token in coalesce_tokens(tokens, STREAM_MAX_DELAY, STREAM_MAX_CHARS):
+            visible.append(token)
+            yield sse_event({'token': token})
                     
-        complete_response = re.sub(r"<think>.*?</think>", "", complete_response, flags=re.DOTALL).strip()
+        complete_response = "".join(visible).strip()
+        if on_complete is not None:
+            on_complete(complete_response)
         
-        yield f"data: {json.dumps({'end': True, 'complete_response': complete_response})}\n\n"
+        yield sse_event({'end': True, 'complete_response': complete_response})
         
     except Exception as e:
         print(f"Error in LLM streaming: {str(e)}")
-        yield f"data: {json.dumps({'error': str(e)})}\n\n"
+        yield sse_event({'error': str(e)})
 
-def get_llm_response(context, question, chat_history=""):
-    client = Groq(api_key=GROQ_API_KEY)
+async def get_llm_response(context, question, chat_history=""):
     model_name = "deepseek-r1-distill-llama-70b"
 
-    history_str = ""
-    if isinstance(chat_history, list):
-        for msg in chat_history:
-            if msg.get("role") == "user":
-                history_str += f"User: {msg.get('content', '')}\n"
-            else:
-                history_str += f"Assistant: {msg.get('content', '')}\n"
-    else:
-        history_str = chat_history
+    history_str = prompt_builder.build_history(chat_history, context, question)
     
     messages = [
         {
@@ -192,30 +247,20 @@ def get_llm_response(context, question, chat_history=""):
     ]
 
     try:
-        chat_completion = client.chat.completions.create(
+        chat_completion = await get_llm_client().complete(
             messages=messages,
             model=model_name,
         )
-        answer = chat_completion.choices[0].message.content.strip()
-        answer = re.sub(r"<think>.*?</think>", "", answer, flags=re.DOTALL).strip()
+        answer = strip_think(chat_completion.choices[0].message.content)
         return answer
     except Exception as e:
         print(f"Error in LLM response: {str(e)}")
-        return "Sorry, I encountered an error processing your request."
+        return LLM_ERROR_MESSAGE
 
-def get_greeting_response(query, chat_history=""):
-    client = Groq(api_key=GROQ_API_KEY)
+async def get_greeting_response(query, chat_history=""):
     model_name = "deepseek-r1-distill-llama-70b"
     
-    history_str = ""
-    if isinstance(chat_history, list):
-        for msg in chat_history:
-            if msg.get("role") == "user":
-                history_str += f"User: {msg.get('content', '')}\n"
-            else:
-                history_str += f"Assistant: {msg.get('content', '')}\n"
-    else:
-        history_str = chat_history
+    history_str = prompt_builder.build_history(chat_history, query)
     
     messages = [
         {
@@ -238,30 +283,20 @@ def get_greeting_response(query, chat_history=""):
     ]
 
     try:
-        chat_completion = client.chat.completions.create(
+        chat_completion = await get_llm_client().complete(
             messages=messages,
             model=model_name,
         )
-        answer = chat_completion.choices[0].message.content.strip()
-        answer = re.sub(r"<think>.*?</think>", "", answer, flags=re.DOTALL).strip()
+        answer = strip_think(chat_completion.choices[0].message.content)
         return answer
     except Exception as e:
         print(f"Error in greeting response: {str(e)}")
         return "Hello! How can I help you with your video questions today?"
 
-async def stream_greeting_response(query, chat_history=""):
-    client = Groq(api_key=GROQ_API_KEY)
+async def stream_greeting_response(query, chat_history="", on_complete=None):
     model_name = "deepseek-r1-distill-llama-70b"
     
-    history_str = ""
-    if isinstance(chat_history, list):
-        for msg in chat_history:
-            if msg.get("role") == "user":
-                history_str += f"User: {msg.get('content', '')}\n"
-            else:
-                history_str += f"Assistant: {msg.get('content', '')}\n"
-    else:
-        history_str = chat_history
+    history_str = prompt_builder.build_history(chat_history, query)
     
     messages = [
         {
@@ -285,28 +320,21 @@ async def stream_greeting_response(query, chat_history=""):
     ]
 
     try:
-        stream = client.chat.completions.create(
-            messages=messages,
-            model=model_name,
-            stream=True,
-        )
-        
-        complete_response = ""
-        for chunk in stream:
-            if hasattr(chunk.choices[0].delta, 'content') and chunk.choices[0].delta.content is not None:
-                token = chunk.choices[0].delta.content
-                complete_response += token
-                token = re.sub(r"<think>.*?</think>", "", token, flags=re.DOTALL).strip()
-                if token:
-                    yield f"data: {json.dumps({'token': token})}\n\n"
-                    await asyncio.sleep(0.01)  
-        complete_response = re.sub(r"<think>.*?</think>", "", complete_response, flags=re.DOTALL).strip()
+        visible = []
+        tokens = filter_think(llm_tokens(messages, model_name))
+        async for token in coalesce_tokens(tokens, STREAM_MAX_DELAY, STREAM_MAX_CHARS):
+            visible.append(token)
+            yield sse_event({'token': token})
+                    
+        complete_response = "".join(visible).strip()
+        if on_complete is not None:
+            on_complete(complete_response)
         
-        yield f"data: {json.dumps({'end': True, 'complete_response': complete_response})}\n\n"
+        yield sse_event({'end': True, 'complete_response': complete_response})
         
     except Exception as e:
         print(f"Error in greeting streaming: {str(e)}")
-        yield f"data: {json.dumps({'error': str(e)})}\n\n"
+        yield sse_event({'error': str(e)})
 
 GITHUB_REPO_OWNER = "FawwazRaza"  # Replace with your GitHub username
 GITHUB_REPO_NAME = "QueryClip"       # Replace with your repository name
@@ -326,28 +354,171 @@ async def get_video(video_filename: str):
     return FileResponse(video_path, media_type="video/mp4")
 
 @app.get("/")
-async def health_check():
-    return {"status": "ok", "message": "API is running"}
+async def health_check(retriever: ChromaRetriever = Depends(get_retriever)):
+    retriever_status = retriever.health()
+    return {
+        "status": "ok" if retriever_status["connected"] else "degraded",
+        "message": "API is running",
+        "retriever": retriever_status,
+        "answer_cache": answer_cache.stats(),
+        "router": local_router.stats(),
+        "reranker": reranker.stats(),
+        "retrieval": retrieval_stats,
+        "llm_client": llm_client_stats(),
+        "sessions": session_store.stats(),
+        "speculative_retrieval": {
+            **speculation_stats,
+            "discard_rate": speculation_stats["discarded"] / speculation_stats["started"] if speculation_stats["started"] else 0.0
+        }
+    }
 
 class QueryRequest(BaseModel):
     query: str
     chat_history: list = []
+    # When set, history is read from and appended to the server-side session store
+    session_id: Optional[str] = None
     stream: bool = False
+    filters: dict = {}
+    # Optional rewrites or sub-questions of query, retrieved together with it
+    expansions: List[str] = []
+
+class BatchQueryRequest(BaseModel):
+    queries: list
+    filters: dict = {}
+
+retrieval_stats = {"early_exits": 0}
+
+def retrieve_chunks(retriever, request):
+    # Overview questions get the precomputed video summaries instead of a few random chunks
+    if OVERVIEW_PATTERN.match(request.query) and not request.expansions:
+        videos = retriever.search_videos(request.query, TOP_K, request.filters or None)
+        if videos:
+            print(f"Answering from {len(videos)} video summaries")
+            return videos
+    fetch_k = reranker.fetch_k(TOP_K)
+    retriever_chain = retriever.as_retriever(search_type=RETRIEVAL_MODE, search_kwargs={
+        "k": fetch_k,
+        "lambda_mult": MMR_LAMBDA,
+        "duplicate_threshold": MMR_DUPLICATE_THRESHOLD
+    })
+    query = [request.query] + request.expansions if request.expansions else request.query
+    candidates = retriever_chain(query, k=fetch_k, filters=request.filters or None)
+    return select_chunks(request.query, candidates, retriever.calibrated)
+
+def select_chunks(query, candidates, calibrated=True):
+    non_empty_chunks = [chunk for chunk in candidates if chunk.get("text", "").strip()]
+    # Scores from an index that is not in cosine space are not comparable to the thresholds
+    relevant_chunks = adaptive_cutoff(non_empty_chunks, MIN_SIMILARITY, SCORE_GAP) if calibrated else non_empty_chunks
+    if non_empty_chunks and not relevant_chunks:
+        retrieval_stats["early_exits"] += 1
+        print("No chunk clears the similarity threshold")
+    top_chunks = reranker.rerank(query, relevant_chunks, TOP_K)
+    if STITCH_CHUNKS:
+        top_chunks = stitch_chunks(top_chunks, STITCH_MAX_GAP)
+    
+    print(f"Retrieved {len(candidates)} candidates, kept {len(top_chunks)} chunks")
+    for i, chunk in enumerate(top_chunks):
+        print(f"Chunk {i+1} similarity: {chunk.get('similarity', 'N/A')}")
+    return top_chunks
+
+def build_context(chunks):
+    """Return the LLM context, source info and chunk payload for retrieved chunks."""
+    top_chunk = max(chunks, key=lambda c: c.get("rerank_score", c.get("similarity") or 0))
+    print(f"Top chunk from: {top_chunk.get('file_name', 'unknown')}")
+
+    combined_context = "\n\n".join(prompt_builder.fit_context([chunk["text"] for chunk in chunks]))
+    context = (
+        f"{combined_context}\n\n"
+        f"Most relevant source: (File: {top_chunk['file_name']}, "
+        f"Start: {top_chunk['start_time']}s, End: {top_chunk['end_time']}s)"
+    )
+
+    source_info = {
+        "file_name": top_chunk["file_name"],
+        "start_time": top_chunk["start_time"],
+        "end_time": top_chunk["end_time"]
+    }
+
+    chunk_payload = [
+        {
+            "text": chunk["text"],
+            "start_time": chunk["start_time"],
+            "end_time": chunk["end_time"],
+            "file_name": chunk["file_name"],
+            "similarity": chunk.get("similarity", None)
+        }
+        for chunk in chunks
+    ]
+    return context, source_info, chunk_payload
+
+speculation_stats = {"started": 0, "used": 0, "discarded": 0}
+
+def discard_task(task):
+    # Speculative work cannot be interrupted once it runs on a thread, just make sure
+    # an exception in a result nobody waits for is not reported as unhandled
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+@app.delete("/session/{session_id}")
+async def delete_session(session_id: str):
+    return {"session_id": session_id, "deleted": session_store.delete(session_id)}
 
 @app.post("/query")
-async def query_endpoint(request: QueryRequest):
+async def query_endpoint(request: QueryRequest, retriever: ChromaRetriever = Depends(get_retriever)):
+    if request.expansions and RETRIEVAL_MODE not in multi_query_types:
+        raise HTTPException(
+            status_code=400,
+            detail=f"expansions are not supported with RETRIEVAL_MODE={RETRIEVAL_MODE}"
+        )
     try:
-        route = route_query(request.query)
+        chat_history = request.chat_history
+        if request.session_id:
+            chat_history = session_store.get(request.session_id) or request.chat_history
+
+        def remember(answer):
+            if not request.session_id or not answer or answer == LLM_ERROR_MESSAGE:
+                return
+            session_store.append(
+                request.session_id,
+                {"role": "user", "content": request.query},
+                {"role": "assistant", "content": answer}
+            )
+
+        # Retrieval starts speculatively alongside routing; its result is thrown
+        # away if the query turns out to be a greeting or unsafe
+        route_task = asyncio.create_task(local_router.aroute(request.query, route_query))
+        retrieval_task = asyncio.create_task(asyncio.to_thread(retrieve_chunks, retriever, request))
+        speculation_stats["started"] += 1
+        cache_key = None
+
+        def cache_answer(answer, source_info, chunk_payload):
+            if cache_key is None or not answer or "Not found in the dataset" in answer or answer == LLM_ERROR_MESSAGE:
+                return
+            query_embedding, chunk_ids, index_version = cache_key
+            answer_cache.store(query_embedding, chunk_ids, {
+                "answer": answer,
+                "source": source_info,
+                "chunks": chunk_payload
+            }, index_version)
+
+        # The route is always awaited first: a cached answer must never bypass the
+        # unsafe check, and greetings should not wait for retrieval
+        route = await route_task
         print(f"Query routed to: {route}")
+        if route in ("DEFAULT", "UNSAFE"):
+            speculation_stats["discarded"] += 1
+            discard_task(retrieval_task)
+        else:
+            speculation_stats["used"] += 1
         
         if route == "DEFAULT":
             if request.stream:
                 return StreamingResponse(
-                    stream_greeting_response(request.query, request.chat_history),
+                    stream_greeting_response(request.query, chat_history, remember),
                     media_type="text/event-stream"
                 )
             else:
-                answer = get_greeting_response(request.query, request.chat_history)
+                answer = await get_greeting_response(request.query, chat_history)
+                remember(answer)
                 return JSONResponse(content={
                     "answer": answer,
                     "source": None,
@@ -355,45 +526,43 @@ async def query_endpoint(request: QueryRequest):
                 })
         
         elif route == "UNSAFE":
-            unsafe_message = "I'm sorry, but I cannot provide information or assistance with that request. Please ask a different question that I can help with."
+            remember(UNSAFE_MESSAGE)
             if request.stream:
-                async def stream_unsafe():
-                    for char in unsafe_message:
-                        yield f"data: {json.dumps({'token': char})}\n\n"
-                        await asyncio.sleep(0.01)
-                    yield f"data: {json.dumps({'end': True, 'complete_response': unsafe_message})}\n\n"
-                return StreamingResponse(stream_unsafe(), media_type="text/event-stream")
+                return StreamingResponse(stream_message(UNSAFE_MESSAGE), media_type="text/event-stream")
             else:
                 return JSONResponse(content={
-                    "answer": unsafe_message,
+                    "answer": UNSAFE_MESSAGE,
                     "source": None,
                     "chunks": []
                 })
         
         else:  
             print("Processing via retriever chain...")
-            TOP_K = 3
-            retriever_chain = ChromaRetriever().as_retriever(search_kwargs={"k": TOP_K})
-            top_chunks = retriever_chain(request.query, k=TOP_K)
-            
-            print(f"Retrieved {len(top_chunks)} chunks")
-            for i, chunk in enumerate(top_chunks):
-                print(f"Chunk {i+1} similarity: {chunk.get('similarity', 'N/A')}")
-            
-            non_empty_chunks = [chunk for chunk in top_chunks if chunk.get("text", "").strip()]
-            print(f"Non-empty chunks: {len(non_empty_chunks)}")
+            non_empty_chunks = await retrieval_task
+
+            # Standalone questions are looked up in the semantic cache before any LLM call.
+            # Follow-ups depend on the chat history, so they always go to the LLM.
+            if not chat_history:
+                query_embedding = embed_query(request.query)
+                chunk_ids = [chunk["id"] for chunk in non_empty_chunks]
+                index_version = retriever.index_version()
+                cached = answer_cache.lookup(query_embedding, chunk_ids, index_version)
+                if cached is not None:
+                    print("Answer served from semantic cache")
+                    remember(cached['answer'])
+                    if request.stream:
+                        metadata = {'source': cached['source'], 'chunks': cached['chunks'], 'cached': True}
+                        return StreamingResponse(stream_message(cached['answer'], metadata), media_type="text/event-stream")
+                    return JSONResponse(content={**cached, "cached": True})
+                cache_key = (query_embedding, chunk_ids, index_version)
             
             if not non_empty_chunks:
                 print("No chunks found in database for this query")
                 not_found_message = "Not found in the dataset."
+                remember(not_found_message)
                 
                 if request.stream:
-                    async def stream_not_found():
-                        for char in not_found_message:
-                            yield f"data: {json.dumps({'token': char})}\n\n"
-                            await asyncio.sleep(0.01)
-                        yield f"data: {json.dumps({'end': True, 'complete_response': not_found_message})}\n\n"
-                    return StreamingResponse(stream_not_found(), media_type="text/event-stream")
+                    return StreamingResponse(stream_message(not_found_message), media_type="text/event-stream")
                 else:
                     return JSONResponse(content={
                         "answer": not_found_message,
@@ -401,48 +570,25 @@ async def query_endpoint(request: QueryRequest):
                         "chunks": []
                     })
             
-            top_chunk = max(non_empty_chunks, key=lambda c: c.get("similarity", 0))
-            print(f"Top chunk from: {top_chunk.get('file_name', 'unknown')}")
-            
-            combined_context = "\n\n".join([chunk["text"] for chunk in non_empty_chunks])
-            context = (
-                f"{combined_context}\n\n"
-                f"Most relevant source: (File: {top_chunk['file_name']}, "
-                f"Start: {top_chunk['start_time']}s, End: {top_chunk['end_time']}s)"
-            )
+            context, source_info, chunk_payload = build_context(non_empty_chunks)
             
             print("Sending context to LLM for answer generation...")
             
             if request.stream:
-                source_info = {
-                    "file_name": top_chunk["file_name"],
-                    "start_time": top_chunk["start_time"],
-                    "end_time": top_chunk["end_time"]
-                }
-                
-                chunk_payload = [
-                    {
-                        "text": chunk["text"],
-                        "start_time": chunk["start_time"],
-                        "end_time": chunk["end_time"],
-                        "file_name": chunk["file_name"],
-                        "similarity": chunk.get("similarity", None)
-                    }
-                    for chunk in non_empty_chunks
-                ]
-                
                 async def stream_with_metadata():
-                    yield f"data: {json.dumps({'metadata': {
-                        'source': source_info,
-                        'chunks': chunk_payload
-                    }})}\n\n"
+                    metadata = {'source': source_info, 'chunks': chunk_payload}
+                    yield sse_event({'metadata': metadata})
                     
-                    async for token in stream_llm_response(context, request.query, request.chat_history):
+                    def on_complete(answer):
+                        cache_answer(answer, source_info, chunk_payload)
+                        remember(answer)
+                    async for token in stream_llm_response(context, request.query, chat_history, on_complete):
                         yield token
                 
                 return StreamingResponse(stream_with_metadata(), media_type="text/event-stream")
             else:
-                answer = get_llm_response(context, request.query, request.chat_history)
+                answer = await get_llm_response(context, request.query, chat_history)
+                remember(answer)
                 
                 print(f"Generated answer: {answer[:100]}...")
                 
@@ -454,23 +600,7 @@ async def query_endpoint(request: QueryRequest):
                         "chunks": []
                     })
                 else:
-                    chunk_payload = [
-                        {
-                            "text": chunk["text"],
-                            "start_time": chunk["start_time"],
-                            "end_time": chunk["end_time"],
-                            "file_name": chunk["file_name"],
-                            "similarity": chunk.get("similarity", None)
-                        }
-                        for chunk in non_empty_chunks
-                    ]
-                    
-                    source_info = {
-                        "file_name": top_chunk["file_name"],
-                        "start_time": top_chunk["start_time"],
-                        "end_time": top_chunk["end_time"]
-                    }
-                    
+                    cache_answer(answer, source_info, chunk_payload)
                     print(f"Returning answer with source from {source_info['file_name']}")
                     return JSONResponse(content={
                         "answer": answer,
@@ -485,6 +615,72 @@ async def query_endpoint(request: QueryRequest):
         raise HTTPException(status_code=500, detail=f"Error processing query: {str(e)}")
     pass
 
+@app.post("/query/batch")
+async def batch_query_endpoint(request: BatchQueryRequest, retriever: ChromaRetriever = Depends(get_retriever)):
+    """Answer many independent questions, streaming one JSON line per answer.
+
+    Queries are routed like /query, retrieved in one batched embedding and
+    vector pass, and answered with at most BATCH_LLM_CONCURRENCY LLM calls
+    (routing fallbacks included) in flight. Lines arrive in completion
+    order; "index" is the position of the query in the request.
+    """
+    queries = [str(query) for query in request.queries]
+    if len(queries) > BATCH_MAX_QUERIES:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_QUERIES} queries per batch")
+
+    semaphore = asyncio.Semaphore(BATCH_LLM_CONCURRENCY)
+
+    async def bounded_route_query(query):
+        async with semaphore:
+            return await route_query(query)
+
+    # One batched forward pass fills the query cache for both the router and batch_search
+    await asyncio.to_thread(embed_queries, queries)
+    routes = await asyncio.gather(*(local_router.aroute(query, bounded_route_query) for query in queries))
+    routes = ["BOT" if route not in ("DEFAULT", "UNSAFE") else route for route in routes]
+    bot_indices = [i for i, route in enumerate(routes) if route == "BOT"]
+    hit_lists = await asyncio.to_thread(
+        retriever.batch_search,
+        [queries[i] for i in bot_indices],
+        k=reranker.fetch_k(TOP_K),
+        search_type=RETRIEVAL_MODE,
+        filters=request.filters or None,
+        lambda_mult=MMR_LAMBDA,
+        duplicate_threshold=MMR_DUPLICATE_THRESHOLD
+    )
+    hits_by_index = dict(zip(bot_indices, hit_lists))
+
+    async def answer(index):
+        query = queries[index]
+        result = {"index": index, "query": query, "route": routes[index], "source": None, "chunks": []}
+        if routes[index] == "UNSAFE":
+            return {**result, "answer": UNSAFE_MESSAGE}
+        if routes[index] == "DEFAULT":
+            async with semaphore:
+                return {**result, "answer": await get_greeting_response(query)}
+
+        # Thresholding and reranking run per query, so answers stream out as each one finishes
+        chunks = await asyncio.to_thread(select_chunks, query, hits_by_index.get(index, []), retriever.calibrated)
+        if not chunks:
+            return {**result, "answer": "Not found in the dataset."}
+        context, source_info, chunk_payload = build_context(chunks)
+        async with semaphore:
+            answer_text = await get_llm_response(context, query)
+        if "Not found in the dataset" in answer_text:
+            return {**result, "answer": answer_text}
+        return {**result, "answer": answer_text, "source": source_info, "chunks": chunk_payload}
+
+    async def results():
+        tasks = [asyncio.create_task(answer(i)) for i in range(len(queries))]
+        try:
+            for task in asyncio.as_completed(tasks):
+                yield json.dumps(await task) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
 # Function to start Ngrok tunnel
 def start_ngrok():
     # Start ngrok tunnel to expose the API
@@ -0,0 +1,22 @@
+import os
+import time
+
+VERSION_FILE = "index_version"
+
+
+def read_index_version(chroma_db_dir):
+    """Return the stamp written by the last ingest, "0" if the index was never stamped."""
+    try:
+        with open(os.path.join(chroma_db_dir, VERSION_FILE), "r", encoding="utf-8") as f:
+            return f.read().strip() or "0"
+    except OSError:
+        return "0"
+
+
+def bump_index_version(chroma_db_dir):
+    # Anything derived from the index (cached answers, ...) compares against this stamp
+    os.makedirs(chroma_db_dir, exist_ok=True)
+    version = str(time.time_ns())
+    with open(os.path.join(chroma_db_dir, VERSION_FILE), "w", encoding="utf-8") as f:
+        f.write(version)
+    return version
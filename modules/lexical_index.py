@@ -0,0 +1,221 @@
+import os
+import re
+import json
+import math
+import heapq
+import threading
+from collections import Counter
+import numpy as np
+
+bm25_dir = "../data/db/bm25"
+MANIFEST = "segments.json"
+
+# Keeps identifiers such as gpt-4, v1.2 and snake_case together as one token
+TOKEN_PATTERN = re.compile(r"[a-z0-9_]+(?:[.\-][a-z0-9_]+)*")
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class Segment:
+    """One immutable batch of documents stored as memory-mapped CSR postings."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "terms.json"), "r", encoding="utf-8") as f:
+            self.terms = {term: i for i, term in enumerate(json.load(f))}
+        with open(os.path.join(path, "ids.json"), "r", encoding="utf-8") as f:
+            self.ids = json.load(f)
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        self.postings = np.load(os.path.join(path, "postings.npy"), mmap_mode="r")
+        self.tfs = np.load(os.path.join(path, "tfs.npy"), mmap_mode="r")
+        self.doc_lens = np.load(os.path.join(path, "doc_lens.npy"), mmap_mode="r")
+        self.live = np.ones(len(self.ids), dtype=bool)
+        # chunk id -> document number, built on the first filtered search
+        self.rows = None
+
+    def docs_for(self, chunk_ids):
+        if self.rows is None:
+            self.rows = {chunk_id: doc for doc, chunk_id in enumerate(self.ids)}
+        return np.fromiter((self.rows[c] for c in chunk_ids if c in self.rows), dtype=np.int64)
+
+    def df(self, term):
+        i = self.terms.get(term)
+        if i is None:
+            return 0
+        return int(np.count_nonzero(self.live[self.postings[self.offsets[i]:self.offsets[i + 1]]]))
+
+    @staticmethod
+    def write(path, ids, token_lists):
+        postings_by_term = {}
+        for doc, tokens in enumerate(token_lists):
+            for term, tf in Counter(tokens).items():
+                postings_by_term.setdefault(term, []).append((doc, tf))
+
+        terms = sorted(postings_by_term)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        postings, tfs = [], []
+        for i, term in enumerate(terms):
+            entries = postings_by_term[term]
+            offsets[i + 1] = offsets[i] + len(entries)
+            postings.extend(doc for doc, _ in entries)
+            tfs.extend(min(tf, 65535) for _, tf in entries)
+
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, "terms.json"), "w", encoding="utf-8") as f:
+            json.dump(terms, f, ensure_ascii=False)
+        with open(os.path.join(path, "ids.json"), "w", encoding="utf-8") as f:
+            json.dump(list(ids), f)
+        np.save(os.path.join(path, "offsets.npy"), offsets)
+        np.save(os.path.join(path, "postings.npy"), np.asarray(postings, dtype=np.int32))
+        np.save(os.path.join(path, "tfs.npy"), np.asarray(tfs, dtype=np.uint16))
+        np.save(os.path.join(path, "doc_lens.npy"), np.asarray([len(t) for t in token_lists], dtype=np.int32))
+
+
+class LexicalIndex:
+    """BM25 index over chunk texts, kept next to the vector store.
+
+    Every add() writes a new segment holding only the new chunks, so
+    incremental ingests never rewrite existing postings. Segments are
+    memory-mapped NumPy arrays; compact() folds them back into one.
+    """
+
+    def __init__(self, index_dir=bm25_dir, k1=1.5, b=0.75):
+        self.index_dir = index_dir
+        self.k1 = k1
+        self.b = b
+        self.lock = threading.Lock()
+        self.segments = []
+        self.manifest_mtime = None
+        self.load()
+
+    def manifest_path(self):
+        return os.path.join(self.index_dir, MANIFEST)
+
+    def load(self):
+        path = self.manifest_path()
+        if not os.path.exists(path):
+            self.segments = []
+            self.manifest_mtime = None
+            return
+        with open(path, "r", encoding="utf-8") as f:
+            names = json.load(f)
+        segments = [Segment(os.path.join(self.index_dir, name)) for name in names]
+
+        # Newer segments win when the same chunk id was indexed twice
+        seen = set()
+        for segment in reversed(segments):
+            for doc, chunk_id in enumerate(segment.ids):
+                if chunk_id in seen:
+                    segment.live[doc] = False
+                seen.add(chunk_id)
+
+        self.segments = segments
+        self.manifest_mtime = os.path.getmtime(path)
+
+    def reload_if_changed(self):
+        path = self.manifest_path()
+        mtime = os.path.getmtime(path) if os.path.exists(path) else None
+        if mtime != self.manifest_mtime:
+            with self.lock:
+                self.load()
+
+    def ids(self):
+        return {chunk_id for segment in self.segments for chunk_id in segment.ids}
+
+    def __len__(self):
+        return sum(int(segment.live.sum()) for segment in self.segments)
+
+    def write_manifest(self, names):
+        os.makedirs(self.index_dir, exist_ok=True)
+        tmp_path = self.manifest_path() + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(names, f)
+        os.replace(tmp_path, self.manifest_path())
+
+    def next_segment_name(self):
+        numbers = [int(os.path.basename(s.path).split("_")[1]) for s in self.segments]
+        return f"seg_{max(numbers, default=0) + 1:05d}"
+
+    def add(self, ids, texts):
+        """Index the chunks whose ids are not in the index yet, returns how many were added."""
+        with self.lock:
+            existing = self.ids()
+            new = [(chunk_id, text) for chunk_id, text in dict(zip(ids, texts)).items() if chunk_id not in existing]
+            if not new:
+                return 0
+            name = self.next_segment_name()
+            Segment.write(os.path.join(self.index_dir, name), [i for i, _ in new], [tokenize(t) for _, t in new])
+            self.write_manifest([os.path.basename(s.path) for s in self.segments] + [name])
+            self.load()
+            return len(new)
+
+    def compact(self):
+        """Merge all segments into one, dropping superseded documents."""
+        with self.lock:
+            if len(self.segments) <= 1:
+                return
+            ids, token_lists = [], []
+            for segment in self.segments:
+                docs = {}
+                for term, i in segment.terms.items():
+                    for doc, tf in zip(segment.postings[segment.offsets[i]:segment.offsets[i + 1]],
+                                       segment.tfs[segment.offsets[i]:segment.offsets[i + 1]]):
+                        if segment.live[doc]:
+                            docs.setdefault(int(doc), []).extend([term] * int(tf))
+                for doc in np.flatnonzero(segment.live):
+                    ids.append(segment.ids[doc])
+                    token_lists.append(docs.get(int(doc), []))
+            name = self.next_segment_name()
+            Segment.write(os.path.join(self.index_dir, name), ids, token_lists)
+            old_paths = [s.path for s in self.segments]
+            self.write_manifest([name])
+            self.load()
+            for path in old_paths:
+                for file_name in os.listdir(path):
+                    os.remove(os.path.join(path, file_name))
+                os.rmdir(path)
+
+    def search(self, query, k=10, allowed=None):
+        """Return [(chunk_id, bm25_score)] for the k best matching chunks.
+
+        allowed is an optional set of chunk ids; other chunks are not scored.
+        """
+        self.reload_if_changed()
+        segments = self.segments
+        terms = set(tokenize(query))
+        if not segments or not terms:
+            return []
+
+        n_docs = sum(int(s.live.sum()) for s in segments)
+        if n_docs == 0:
+            return []
+        avgdl = sum(float(s.doc_lens[s.live].sum()) for s in segments) / n_docs
+        idf = {}
+        for term in terms:
+            df = sum(s.df(term) for s in segments)
+            if df:
+                idf[term] = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+
+        candidates = []
+        for segment in segments:
+            scores = np.zeros(len(segment.ids), dtype=np.float32)
+            norm = self.k1 * (1 - self.b + self.b * np.asarray(segment.doc_lens, dtype=np.float32) / avgdl)
+            for term, term_idf in idf.items():
+                i = segment.terms.get(term)
+                if i is None:
+                    continue
+                docs = segment.postings[segment.offsets[i]:segment.offsets[i + 1]]
+                tf = segment.tfs[segment.offsets[i]:segment.offsets[i + 1]].astype(np.float32)
+                scores[docs] += term_idf * tf * (self.k1 + 1) / (tf + norm[docs])
+            scores[~segment.live] = 0
+            if allowed is not None:
+                mask = np.zeros(len(segment.ids), dtype=bool)
+                mask[segment.docs_for(allowed)] = True
+                scores[~mask] = 0
+            top = np.flatnonzero(scores)
+            if len(top) > k:
+                top = top[np.argpartition(scores[top], -k)[-k:]]
+            candidates.extend((segment.ids[doc], float(scores[doc])) for doc in top)
+        return heapq.nlargest(k, candidates, key=lambda hit: hit[1])
@@ -0,0 +1,121 @@
+import os
+import asyncio
+import httpx
+from groq import AsyncGroq
+
+
+class LLMClient:
+    """One pooled Groq client per process with a cap on in-flight completions.
+
+    The underlying httpx client keeps connections alive between calls, so
+    requests after the first skip connection and TLS setup. Completions
+    beyond max_concurrency wait on a semaphore instead of piling onto the API.
+    """
+
+    def __init__(self, api_key=None, base_url=None, max_concurrency=16, timeout=60.0, connect_timeout=5.0,
+                 max_connections=32, max_keepalive=16, keepalive_expiry=30.0, max_retries=2):
+        self.http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive,
+                keepalive_expiry=keepalive_expiry
+            ),
+            timeout=httpx.Timeout(timeout, connect=connect_timeout)
+        )
+        self.client = AsyncGroq(
+            api_key=api_key,
+            base_url=base_url,
+            max_retries=max_retries,
+            http_client=self.http_client
+        )
+        self.max_concurrency = max_concurrency
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.in_flight = 0
+        self.waiting = 0
+        self.completed = 0
+        self.failed = 0
+
+    async def acquire(self):
+        self.waiting += 1
+        try:
+            await self.semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+
+    def release(self, failed=False):
+        self.in_flight -= 1
+        if failed:
+            self.failed += 1
+        else:
+            self.completed += 1
+        self.semaphore.release()
+
+    async def complete(self, **kwargs):
+        await self.acquire()
+        failed = True
+        try:
+            completion = await self.client.chat.completions.create(**kwargs)
+            failed = False
+            return completion
+        finally:
+            self.release(failed)
+
+    async def stream(self, **kwargs):
+        """Yield completion chunks; the concurrency slot is held until the stream ends."""
+        await self.acquire()
+        failed = True
+        stream = None
+        try:
+            stream = await self.client.chat.completions.create(stream=True, **kwargs)
+            async for chunk in stream:
+                yield chunk
+            failed = False
+        finally:
+            if stream is not None:
+                # A consumer that stops early (client disconnect, cancelled read) would
+                # otherwise keep the pooled connection checked out
+                await stream.close()
+            self.release(failed)
+
+    async def aclose(self):
+        await self.http_client.aclose()
+
+    def stats(self):
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "completed": self.completed,
+            "failed": self.failed
+        }
+
+
+llm_client = None
+
+
+def get_llm_client():
+    global llm_client
+    if llm_client is None:
+        llm_client = LLMClient(
+            api_key=os.getenv("GROQ_API_KEY"),
+            # Point GROQ_BASE_URL at mock_llm_server.py to run without the Groq API
+            base_url=os.getenv("GROQ_BASE_URL") or None,
+            max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "16")),
+            timeout=float(os.getenv("LLM_TIMEOUT", "60")),
+            connect_timeout=float(os.getenv("LLM_CONNECT_TIMEOUT", "5")),
+            max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", "32")),
+            max_keepalive=int(os.getenv("LLM_MAX_KEEPALIVE", "16"))
+        )
+    return llm_client
+
+
+def llm_client_stats():
+    return llm_client.stats() if llm_client is not None else None
+
+
+async def close_llm_client():
+    global llm_client
+    if llm_client is not None:
+        await llm_client.aclose()
+        llm_client = None
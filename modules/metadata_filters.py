@@ -0,0 +1,57 @@
+import re
+
+
+def tag_key(tag):
+    # Chroma metadata values cannot be lists, so each tag is stored as its own boolean field
+    return "tag_" + re.sub(r"[^a-z0-9]+", "_", str(tag).lower()).strip("_")
+
+
+def tag_metadata(tags):
+    return {tag_key(tag): True for tag in tags or []}
+
+
+def as_list(value):
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple, set)):
+        return list(value)
+    return [value]
+
+
+def build_where(filters):
+    """Translate retriever filters into a Chroma where clause.
+
+    Supported filters:
+      file_name: a file name or list of file names
+      time_range: (start, end) in seconds, matches chunks overlapping the window
+      tags: list of tags, all of which must be present
+
+    Chroma resolves the where clause against its metadata index before the
+    vector scan, so only matching chunks are ranked.
+    """
+    if not filters:
+        return None
+
+    clauses = []
+    file_names = as_list(filters.get("file_name"))
+    if len(file_names) == 1:
+        clauses.append({"file_name": file_names[0]})
+    elif file_names:
+        clauses.append({"file_name": {"$in": file_names}})
+
+    time_range = filters.get("time_range")
+    if time_range:
+        start, end = time_range
+        if end is not None:
+            clauses.append({"start_time": {"$lte": end}})
+        if start is not None:
+            clauses.append({"end_time": {"$gte": start}})
+
+    for tag in as_list(filters.get("tags")):
+        clauses.append({tag_key(tag): True})
+
+    if not clauses:
+        return None
+    if len(clauses) == 1:
+        return clauses[0]
+    return {"$and": clauses}
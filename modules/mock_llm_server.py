@@ -0,0 +1,59 @@
+import os
+import json
+import time
+import asyncio
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+import uvicorn
+
+# Minimal stand-in for the Groq chat completions API, for load tests and local runs:
+#   python mock_llm_server.py
+#   GROQ_BASE_URL=http://localhost:9000 GROQ_API_KEY=mock python -m uvicorn fastapi_backend_updated:app
+MOCK_LATENCY = float(os.getenv("MOCK_LLM_LATENCY", "0.2"))
+MOCK_TOKEN_DELAY = float(os.getenv("MOCK_LLM_TOKEN_DELAY", "0.01"))
+MOCK_REPLY = os.getenv("MOCK_LLM_REPLY", "This is a mock answer from the local completion server.")
+
+app = FastAPI()
+
+
+def reply_for(model):
+    # The router model only ever answers with a route name
+    return "BOT" if model.startswith("qwen") else MOCK_REPLY
+
+
+@app.post("/openai/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    model = body.get("model", "mock")
+    reply = reply_for(model)
+    created = int(time.time())
+    await asyncio.sleep(MOCK_LATENCY)
+
+    if not body.get("stream"):
+        return JSONResponse(content={
+            "id": "mock-completion",
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        })
+
+    async def stream():
+        for word in reply.split(" "):
+            chunk = {
+                "id": "mock-completion",
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}]
+            }
+            yield f"data: {json.dumps(chunk)}\n\n"
+            await asyncio.sleep(MOCK_TOKEN_DELAY)
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+
+if __name__ == "__main__":
+    uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("MOCK_LLM_PORT", "9000")))
@@ -0,0 +1,154 @@
+import os
+import re
+import math
+import hashlib
+import threading
+from collections import OrderedDict
+
+try:
+    import tiktoken
+    encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    # tiktoken is optional, ~4 characters per token is close enough for budgeting
+    encoding = None
+
+
+def count_tokens(text):
+    if not text:
+        return 0
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return math.ceil(len(text) / 4)
+
+
+def truncate_to_tokens(text, max_tokens):
+    if count_tokens(text) <= max_tokens:
+        return text
+    if encoding is not None:
+        return encoding.decode(encoding.encode(text)[:max_tokens])
+    return text[:max_tokens * 4]
+
+
+def format_turn(msg):
+    role = "User" if msg.get("role") == "user" else "Assistant"
+    return f"{role}: {msg.get('content', '')}\n"
+
+
+def first_sentence(text, max_words=25):
+    sentence = re.split(r"(?<=[.!?])\s+", text.strip(), maxsplit=1)[0]
+    words = sentence.split()
+    if len(words) > max_words:
+        sentence = " ".join(words[:max_words]) + " ..."
+    return sentence
+
+
+class PromptBuilder:
+    """Fits retrieved context and chat history into a prompt token budget.
+
+    The most recent turns are kept verbatim. Older turns are folded into a
+    rolling extractive summary (the first sentence of each turn), which is
+    cached by a hash chain over the turns so each new turn only summarizes
+    the turns that just aged out instead of the whole conversation.
+    reserve_tokens covers the system prompt and template text around the
+    context, history and question.
+    """
+
+    def __init__(self, max_prompt_tokens=6000, context_tokens=2500, recent_turns=6,
+                 summary_tokens=400, reserve_tokens=200, cache_size=256):
+        self.max_prompt_tokens = max_prompt_tokens
+        self.context_tokens = context_tokens
+        self.recent_turns = recent_turns
+        self.summary_tokens = summary_tokens
+        self.reserve_tokens = reserve_tokens
+        self.cache_size = cache_size
+        self.summaries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def fit_context(self, texts, max_tokens=None):
+        """Keep retrieved texts in rank order until the context budget is used up."""
+        budget = self.context_tokens if max_tokens is None else max_tokens
+        kept = []
+        for text in texts:
+            tokens = count_tokens(text)
+            if tokens > budget:
+                if not kept:
+                    kept.append(truncate_to_tokens(text, budget))
+                break
+            kept.append(text)
+            budget -= tokens
+        return kept
+
+    def summarize(self, turns, previous=""):
+        lines = previous.splitlines() if previous else []
+        for msg in turns:
+            role = "User asked" if msg.get("role") == "user" else "Assistant answered"
+            lines.append(f"- {role}: {first_sentence(msg.get('content', ''))}")
+        return self.trim_summary(lines, self.summary_tokens)
+
+    def trim_summary(self, lines, max_tokens):
+        # Oldest lines go first once the summary outgrows its budget
+        while lines and count_tokens("\n".join(lines)) > max_tokens:
+            lines = lines[1:]
+        return "\n".join(lines)
+
+    def rolling_summary(self, turns):
+        chain = []
+        digest = ""
+        for msg in turns:
+            digest = hashlib.sha1(f"{digest}|{msg.get('role')}|{msg.get('content', '')}".encode("utf-8")).hexdigest()
+            chain.append(digest)
+
+        with self.lock:
+            start, summary = 0, ""
+            for n in range(len(chain), 0, -1):
+                if chain[n - 1] in self.summaries:
+                    start, summary = n, self.summaries[chain[n - 1]]
+                    self.summaries.move_to_end(chain[n - 1])
+                    break
+
+        if start < len(turns):
+            summary = self.summarize(turns[start:], summary)
+            with self.lock:
+                self.summaries[chain[-1]] = summary
+                while len(self.summaries) > self.cache_size:
+                    self.summaries.popitem(last=False)
+        return summary
+
+    def history_budget(self, *fixed_parts):
+        used = sum(count_tokens(part) for part in fixed_parts)
+        return max(0, self.max_prompt_tokens - self.reserve_tokens - used)
+
+    def build_history(self, chat_history, *fixed_parts):
+        """Return the chat history string that fits next to fixed_parts in the prompt."""
+        if not isinstance(chat_history, list):
+            return truncate_to_tokens(chat_history or "", self.history_budget(*fixed_parts))
+        if not chat_history:
+            return ""
+
+        budget = self.history_budget(*fixed_parts)
+        recent = chat_history[-self.recent_turns:] if self.recent_turns else []
+        older = chat_history[:len(chat_history) - len(recent)]
+
+        # Drop verbatim turns from the front until they fit, they move to the summary
+        recent_lines = [format_turn(msg) for msg in recent]
+        while recent_lines and count_tokens("".join(recent_lines)) > budget:
+            older = older + [recent[len(recent) - len(recent_lines)]]
+            recent_lines.pop(0)
+
+        history_str = "".join(recent_lines)
+        if older:
+            summary_budget = budget - count_tokens(history_str)
+            if summary_budget > 0:
+                summary = self.trim_summary(self.rolling_summary(older).splitlines(), summary_budget)
+                if summary:
+                    history_str = f"Summary of earlier conversation:\n{summary}\n" + history_str
+        return history_str
+
+
+def build_prompt_builder():
+    return PromptBuilder(
+        max_prompt_tokens=int(os.getenv("PROMPT_MAX_TOKENS", "6000")),
+        context_tokens=int(os.getenv("PROMPT_CONTEXT_TOKENS", "2500")),
+        recent_turns=int(os.getenv("PROMPT_RECENT_TURNS", "6")),
+        summary_tokens=int(os.getenv("PROMPT_SUMMARY_TOKENS", "400"))
+    )
@@ -1,7 +1,8 @@
 import os
 from dotenv import load_dotenv
-from retriever import ChromaRetriever
+from retriever import ChromaRetriever, warmup
 from groq import Groq
+from streaming import strip_think
 
 load_dotenv()
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
@@ -27,11 +28,13 @@ def get_llm_response(context, question):
         messages=messages,
         model=model_name,
     )
-    return chat_completion.choices[0].message.content.strip()
+    return strip_think(chat_completion.choices[0].message.content)
 
 def main():
     TOP_K = 3
 
+    # Load the embedding model while the user types the first question
+    warmup(background=True)
     retriever_chain = ChromaRetriever().as_retriever(search_kwargs={"k": TOP_K})
 
     print("Welcome to the RAG Chatbot. Type your question (or 'exit' to quit):")
@@ -0,0 +1,105 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+rerank_model = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+
+class Reranker:
+    """Rescores retrieved chunks against the query with a small cross-encoder.
+
+    All (query, chunk) pairs are scored in one batch on a worker thread. If
+    scoring does not finish within budget seconds, or the model is not loaded
+    yet, the hits keep their retrieval order, so reranking can only add
+    bounded latency. A scoring call that overruns keeps the worker busy, so
+    the calls queued behind it fall back too instead of piling up.
+    """
+
+    def __init__(self, model_name=rerank_model, candidates=20, budget=0.25, enabled=True):
+        self.model_name = model_name
+        self.candidates = candidates
+        self.budget = budget
+        self.enabled = enabled
+        self.model = None
+        self.state = "not loaded"
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="reranker")
+        self.counts = {"reranked": 0, "timeouts": 0, "fallbacks": 0}
+
+    def load_model(self):
+        if self.state in ("loaded", "fallback"):
+            return
+        with self.lock:
+            if self.state in ("loaded", "fallback"):
+                return
+            self.state = "loading"
+            try:
+                from sentence_transformers import CrossEncoder
+                self.model = CrossEncoder(self.model_name)
+                self.state = "loaded"
+            except Exception as e:
+                print(f"Error loading reranker: {str(e)}")
+                print("Reranking disabled, hits keep their retrieval order")
+                self.model = None
+                self.state = "fallback"
+
+    def warmup(self, background=False):
+        if not self.enabled:
+            return None
+        if not background:
+            self.load_model()
+            return None
+        thread = threading.Thread(target=self.load_model, name="reranker-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def fetch_k(self, k):
+        """Number of candidates to retrieve when k hits are wanted after reranking."""
+        if not self.enabled or self.state == "fallback":
+            return k
+        return max(k, self.candidates)
+
+    def score(self, query, texts):
+        return self.model.predict([(query, text) for text in texts])
+
+    def rerank(self, query, hits, k, budget=None):
+        if not self.enabled or len(hits) <= 1:
+            return hits[:k]
+        if self.state != "loaded":
+            # Never wait for the model load on the request path
+            if self.state == "not loaded":
+                self.warmup(background=True)
+            self.counts["fallbacks"] += 1
+            return hits[:k]
+
+        future = self.executor.submit(self.score, query, [hit["text"] for hit in hits])
+        try:
+            scores = future.result(timeout=self.budget if budget is None else budget)
+        except TimeoutError:
+            self.counts["timeouts"] += 1
+            print("Reranking exceeded its budget, using retrieval order")
+            return hits[:k]
+        except Exception as e:
+            print(f"Error in reranking: {str(e)}")
+            self.counts["fallbacks"] += 1
+            return hits[:k]
+
+        self.counts["reranked"] += 1
+        order = sorted(range(len(hits)), key=lambda i: float(scores[i]), reverse=True)[:k]
+        return [{**hits[i], "rerank_score": float(scores[i])} for i in order]
+
+    def stats(self):
+        return {"enabled": self.enabled, "model": self.state, "candidates": self.candidates,
+                "budget": self.budget, **self.counts}
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+
+def build_reranker():
+    return Reranker(
+        model_name=os.getenv("RERANK_MODEL", rerank_model),
+        candidates=int(os.getenv("RERANK_CANDIDATES", "20")),
+        budget=float(os.getenv("RERANK_BUDGET", "0.25")),
+        enabled=os.getenv("RERANK_ENABLED", "1") == "1"
+    )
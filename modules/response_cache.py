@@ -0,0 +1,94 @@
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+
+
+class SemanticCache:
+    """Caches answers by query embedding so paraphrased questions can be replayed.
+
+    A lookup hits when a stored query has cosine similarity >= threshold with
+    the new one and the retriever returned the same chunk ids for both, so a
+    replayed answer was generated from the same context. Entries are evicted
+    LRU beyond maxsize, expire after ttl seconds, and the whole cache is
+    dropped when the index version changes.
+    """
+
+    def __init__(self, threshold=0.9, maxsize=512, ttl=86400):
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.index_version = None
+        self.next_key = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize(embedding):
+        embedding = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(embedding)
+        return embedding / norm if norm > 0 else embedding
+
+    def check_version(self, index_version):
+        if index_version != self.index_version:
+            self.entries.clear()
+            self.index_version = index_version
+
+    def expire(self):
+        now = time.monotonic()
+        for key in [key for key, entry in self.entries.items() if now - entry["created"] > self.ttl]:
+            del self.entries[key]
+
+    def lookup(self, query_embedding, chunk_ids, index_version):
+        """Return the cached response for a matching query, or None."""
+        with self.lock:
+            self.check_version(index_version)
+            self.expire()
+            if not self.entries:
+                self.misses += 1
+                return None
+
+            keys = list(self.entries)
+            matrix = np.stack([self.entries[key]["embedding"] for key in keys])
+            similarities = matrix @ self.normalize(query_embedding)
+            chunk_ids = tuple(chunk_ids)
+            for i in np.argsort(-similarities):
+                if similarities[i] < self.threshold:
+                    break
+                entry = self.entries[keys[i]]
+                if entry["chunk_ids"] == chunk_ids:
+                    self.entries.move_to_end(keys[i])
+                    self.hits += 1
+                    return entry["response"]
+            self.misses += 1
+            return None
+
+    def store(self, query_embedding, chunk_ids, response, index_version):
+        with self.lock:
+            self.check_version(index_version)
+            self.entries[self.next_key] = {
+                "embedding": self.normalize(query_embedding),
+                "chunk_ids": tuple(chunk_ids),
+                "response": response,
+                "created": time.monotonic()
+            }
+            self.next_key += 1
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def invalidate(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
@@ -1,39 +1,186 @@
-import chromadb
-from chromadb.config import Settings
-from transformers import AutoTokenizer, AutoModel
-import torch
 import os
+import re
+import time
 import numpy as np
 import hashlib
+import heapq
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from sharding import shard_collection_name, list_shards, collection_names
+from metadata_filters import build_where, as_list
+from lexical_index import LexicalIndex, bm25_dir
+from index_version import read_index_version
+from video_index import video_collection_name
+from binary_index import BinaryIndex, binary_dir
 
 chroma_dir = "../data/db/chroma_db"
-os.makedirs(chroma_dir, exist_ok=True)
 collect_name = "video_chunks"
 modeln = "sentence-transformers/all-MiniLM-L6-v2"
+# Collections are built in cosine space over unit-length embeddings
+collection_metadata = {"hnsw:space": "cosine"}
 
-try:
-    tokenizer = AutoTokenizer.from_pretrained(modeln)
-    model = AutoModel.from_pretrained(modeln)
-except Exception as e:
-    print(f"Error loading model: {str(e)}")
-    print("Using fallback embedding method")
-    tokenizer = None
-    model = None
+# torch/transformers are imported and the model is loaded on first use (or by
+# warmup()), so importing this module stays cheap for the backends and CLI tools
+tokenizer = None
+model = None
+model_state = "not loaded"
+model_lock = threading.Lock()
+
+def load_model():
+    global tokenizer, model, model_state
+    if model_state in ("loaded", "fallback"):
+        return
+    with model_lock:
+        if model_state in ("loaded", "fallback"):
+            return
+        model_state = "loading"
+        try:
+            from transformers import AutoTokenizer, AutoModel
+            tokenizer = AutoTokenizer.from_pretrained(modeln)
+            model = AutoModel.from_pretrained(modeln)
+            model.eval()
+            model_state = "loaded"
+        except Exception as e:
+            print(f"Error loading model: {str(e)}")
+            print("Using fallback embedding method")
+            tokenizer = None
+            model = None
+            model_state = "fallback"
+
+def warmup(background=False):
+    """Load the embedding model now instead of on the first query.
+
+    With background=True the model loads on a daemon thread and the thread is
+    returned; queries arriving before it finishes wait for the same load.
+    """
+    if not background:
+        load_model()
+        return None
+    thread = threading.Thread(target=load_model, name="retriever-warmup", daemon=True)
+    thread.start()
+    return thread
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
 
 def embed_text(text):
+    load_model()
     if tokenizer is not None and model is not None:
         try:
+            import torch
             inputs = tokenizer([text], padding=True, truncation=True, return_tensors="pt")
             with torch.no_grad():
                 outputs = model(**inputs)
                 embedding = outputs.last_hidden_state.mean(dim=1).cpu().numpy()[0]
-            return embedding
+            return normalize(embedding)
         except Exception as e:
             print(f"Error in embedding: {str(e)}")
             # Fall back to simple hash-based embedding
-            return simple_embedding(text)
+            return normalize(simple_embedding(text))
     else:
-        return simple_embedding(text)
+        return normalize(simple_embedding(text))
+
+def embed_texts(texts, batch_size=32):
+    """Embed many texts with one forward pass per batch; rows match embed_text(text)."""
+    load_model()
+    if tokenizer is not None and model is not None and texts:
+        try:
+            import torch
+            embeddings = []
+            for i in range(0, len(texts), batch_size):
+                inputs = tokenizer(texts[i:i + batch_size], padding=True, truncation=True, return_tensors="pt")
+                with torch.no_grad():
+                    outputs = model(**inputs)
+                    # Average over real tokens only so padding does not change the embedding
+                    mask = inputs["attention_mask"].unsqueeze(-1).to(outputs.last_hidden_state.dtype)
+                    summed = (outputs.last_hidden_state * mask).sum(dim=1)
+                    embeddings.append((summed / mask.sum(dim=1).clamp(min=1)).cpu().numpy())
+            return normalize(np.concatenate(embeddings))
+        except Exception as e:
+            print(f"Error in batch embedding: {str(e)}")
+    return normalize(np.array([simple_embedding(text) for text in texts]).reshape(len(texts), -1))
+
+class EmbeddingCache:
+    """Thread-safe LRU cache of query embeddings whose entries expire after ttl seconds."""
+
+    def __init__(self, maxsize=1024, ttl=3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and time.monotonic() - entry[1] <= self.ttl:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+query_cache = EmbeddingCache(
+    maxsize=int(os.getenv("EMBEDDING_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("EMBEDDING_CACHE_TTL", "3600"))
+)
+
+def normalize_query(text):
+    # "Summarize the video?" and "summarize  the video" share one cache entry
+    text = re.sub(r"\s+", " ", text.lower()).strip()
+    return text.strip("?!.,;: ")
+
+def embed_query(text):
+    """Embed a search query, reusing the cached embedding of the normalized text."""
+    key = normalize_query(text) or text
+    embedding = query_cache.get(key)
+    if embedding is None:
+        embedding = np.asarray(embed_text(key))
+        embedding.setflags(write=False)
+        query_cache.put(key, embedding)
+    return embedding
+
+def embed_queries(texts):
+    """Batch version of embed_query: cached queries are reused, the rest are embedded together."""
+    keys = [normalize_query(text) or text for text in texts]
+    embeddings = {}
+    for key in keys:
+        if key not in embeddings:
+            embeddings[key] = query_cache.get(key)
+    missing = [key for key, embedding in embeddings.items() if embedding is None]
+    if missing:
+        for key, embedding in zip(missing, embed_texts(missing)):
+            embedding.setflags(write=False)
+            query_cache.put(key, embedding)
+            embeddings[key] = embedding
+    return [embeddings[key] for key in keys]
 
 def simple_embedding(text):
     
@@ -52,19 +199,142 @@ def simple_embedding(text):
     return embedding
 
 
+def distance_space(collection):
+    space = (collection.metadata or {}).get("hnsw:space")
+    if space is None:
+        try:
+            space = collection.configuration["hnsw"]["space"]
+        except Exception:
+            space = "l2"
+    return space
+
+def distance_to_similarity(distance, space="cosine"):
+    """Map a Chroma distance between unit vectors to their cosine similarity, clipped to [0, 1]."""
+    if space == "l2":
+        # Chroma's l2 is the squared distance, 2 - 2cos for unit vectors
+        cosine = 1 - distance / 2
+    else:
+        # cosine and ip distances are both 1 - cos for unit vectors
+        cosine = 1 - distance
+    return float(min(1.0, max(0.0, cosine)))
+
+
+def reciprocal_rank_fusion(result_lists, k, rrf_k=60):
+    """Fuse ranked hit lists by summing 1 / (rrf_k + rank) per chunk id."""
+    fused = {}
+    scores = {}
+    for hits in result_lists:
+        for rank, hit in enumerate(hits, 1):
+            chunk_id = hit["id"]
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (rrf_k + rank)
+            if chunk_id in fused:
+                # Merge the fields each search contributed (similarity, bm25_score, ...),
+                # keeping the best similarity any list gave the chunk
+                merged = {**hit, **fused[chunk_id]}
+                similarities = [s for s in (hit.get("similarity"), fused[chunk_id].get("similarity")) if s is not None]
+                merged["similarity"] = max(similarities) if similarities else None
+                fused[chunk_id] = merged
+            else:
+                fused[chunk_id] = dict(hit)
+    ranked = sorted(fused, key=scores.get, reverse=True)[:k]
+    return [{**fused[chunk_id], "score": scores[chunk_id]} for chunk_id in ranked]
+
+
+# Search types multi_query_search can run, the others only take a single query
+multi_query_types = ("similarity", "hybrid", "mmr")
+
+
+def max_score_fusion(result_lists, k):
+    """Merge hit lists keeping each chunk once, at the best similarity any list gave it."""
+    best = {}
+    for hits in result_lists:
+        for hit in hits:
+            current = best.get(hit["id"])
+            if current is None or (hit.get("similarity") or 0) > (current.get("similarity") or 0):
+                best[hit["id"]] = hit
+    ranked = sorted(best.values(), key=lambda hit: hit.get("similarity") or 0, reverse=True)[:k]
+    return [{**hit, "score": hit.get("similarity")} for hit in ranked]
+
+
+def adaptive_cutoff(hits, min_similarity=None, max_gap=None, min_k=1):
+    """Drop hits that are weak relative to the score distribution, keeping their order.
+
+    Hits below min_similarity are always dropped, so the result can be empty.
+    With max_gap, similarities are scanned from best to worst and everything
+    after the first drop larger than max_gap (past the first min_k) is cut.
+    """
+    scores = sorted(((hit.get("similarity") or 0.0) for hit in hits), reverse=True)
+    cutoff = -np.inf if min_similarity is None else min_similarity
+    if max_gap is not None:
+        for i in range(max(min_k, 1), len(scores)):
+            if scores[i - 1] - scores[i] > max_gap:
+                cutoff = max(cutoff, scores[i - 1])
+                break
+    return [hit for hit in hits if (hit.get("similarity") or 0.0) >= cutoff]
+
+
+def mmr_select(query_embedding, hits, k, lambda_mult=0.5, duplicate_threshold=None):
+    """Pick k hits by maximal marginal relevance over their "embedding" fields.
+
+    Each step takes the hit maximizing lambda_mult * sim(query, hit) -
+    (1 - lambda_mult) * max sim(hit, already picked). Hits whose cosine
+    similarity to a picked hit is at least duplicate_threshold are dropped.
+    """
+    if not hits:
+        return []
+    matrix = np.asarray([hit["embedding"] for hit in hits], dtype=np.float32)
+    matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+    query = np.asarray(query_embedding, dtype=np.float32)
+    relevance = matrix @ (query / max(np.linalg.norm(query), 1e-12))
+    pairwise = matrix @ matrix.T
+
+    available = np.ones(len(hits), dtype=bool)
+    redundancy = np.full(len(hits), -np.inf, dtype=np.float32)
+    selected = []
+    while len(selected) < k and available.any():
+        scores = relevance if not selected else lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        best = int(np.argmax(np.where(available, scores, -np.inf)))
+        selected.append(best)
+        available[best] = False
+        redundancy = np.maximum(redundancy, pairwise[best])
+        if duplicate_threshold is not None:
+            available &= pairwise[best] < duplicate_threshold
+    return [hits[i] for i in selected]
+
+
+def merge_hits(hit_lists, k):
+    """Merge per-collection hit lists sorted by similarity, keeping one hit per chunk id."""
+    seen = set()
+    merged = []
+    for hit in heapq.merge(*hit_lists, key=lambda hit: hit["similarity"], reverse=True):
+        if hit["id"] in seen:
+            continue
+        seen.add(hit["id"])
+        merged.append(hit)
+        if len(merged) == k:
+            break
+    return merged
+
+
 class ChromaRetriever:
-    def __init__(self, chroma_db_dir=chroma_dir, collection_name=collect_name, default_k=5):
+    def __init__(self, chroma_db_dir=chroma_dir, collection_name=collect_name, default_k=5, shards=None, max_workers=8,
+                 lexical_dir=bm25_dir, compressed_dir=binary_dir):
+        self.chroma_db_dir = chroma_db_dir
+        self.collection_name = collection_name
+        self.shard_collections = {}
+        self.shard_by = None
+        self.search_base = True
+        self.calibrated = False
+        self.video_collection = None
+        self.requested_shards = shards
+        self.loaded_version = None
+        self.reload_lock = threading.Lock()
         try:
+            import chromadb
+            os.makedirs(chroma_db_dir, exist_ok=True)
             self.client = chromadb.PersistentClient(path=chroma_db_dir)
-            try:
-                self.collection = self.client.get_collection(collection_name)
-                print(f"Successfully connected to collection: {collection_name}")
-            except Exception as e:
-                print(f"Collection {collection_name} not found, creating a new one")
-                self.collection = self.client.create_collection(
-                    name=collection_name,
-                    metadata={"description": "Video chunks collection"}
-                )
+            self.loaded_version = self.index_version()
+            self.load_collections()
         except Exception as e:
             print(f"Error initializing ChromaDB: {str(e)}")
             # Create a dummy fallback for testing purposes
@@ -72,8 +342,319 @@ class ChromaRetriever:
             self.collection = None
         
         self.default_k = default_k
+        # The BM25 and binary indexes and the fan-out thread pool are created on first
+        # use, so a retriever that only runs similarity_search stays cheap to build
+        self.max_workers = max_workers
+        self.lexical_dir = lexical_dir
+        self.compressed_dir = compressed_dir
+        self.lazy_objects = {}
+        self.lazy_lock = threading.Lock()
+
+    def load_lazy(self, name, factory):
+        if name in self.lazy_objects:
+            return self.lazy_objects[name]
+        with self.lazy_lock:
+            if name not in self.lazy_objects:
+                try:
+                    self.lazy_objects[name] = factory()
+                except Exception as e:
+                    # A failed load is not retried, the searches using it fall back
+                    print(f"Error loading {name}: {str(e)}")
+                    self.lazy_objects[name] = None
+            return self.lazy_objects[name]
+
+    def get_executor(self):
+        return self.load_lazy("thread pool", lambda: ThreadPoolExecutor(max_workers=self.max_workers))
+
+    def get_lexical_index(self):
+        return self.load_lazy("lexical index", lambda: LexicalIndex(self.lexical_dir))
+
+    def get_binary_index(self):
+        return self.load_lazy("binary index", lambda: BinaryIndex(self.compressed_dir))
+
+    def load_collections(self):
+        try:
+            self.collection = self.client.get_collection(self.collection_name)
+            print(f"Successfully connected to collection: {self.collection_name}")
+        except Exception as e:
+            print(f"Collection {self.collection_name} not found, creating a new one")
+            self.collection = self.client.create_collection(
+                name=self.collection_name,
+                metadata={"description": "Video chunks collection", **collection_metadata}
+            )
+        self.load_shards(self.requested_shards)
+        if video_collection_name in collection_names(self.client):
+            self.video_collection = self.client.get_collection(video_collection_name)
+        else:
+            self.video_collection = None
+
+    def reload_if_changed(self):
+        # Every ingest bumps the index version after adding, dropping or recreating
+        # collections, so the handles are looked up again once it changes
+        if self.client is None:
+            return
+        version = self.index_version()
+        if version == self.loaded_version:
+            return
+        with self.reload_lock:
+            if version == self.loaded_version:
+                return
+            try:
+                # A fresh client, since the cached one keeps serving the vector segments
+                # it read before another process (vector_store.py) rewrote them
+                import chromadb
+                from chromadb.api.client import SharedSystemClient
+                SharedSystemClient.clear_system_cache()
+                self.client = chromadb.PersistentClient(path=self.chroma_db_dir)
+                self.load_collections()
+                self.loaded_version = version
+            except Exception as e:
+                print(f"Error reloading collections: {str(e)}")
+
+    def load_shards(self, shards=None):
+        # shards=None picks up every shard collection on disk, a list restricts to those shard keys
+        self.requested_shards = shards
+        if shards is None:
+            names = list_shards(self.client, self.collection_name)
+        else:
+            names = [shard_collection_name(self.collection_name, shard) for shard in shards]
+        shard_collections = {}
+        shard_by = None
+        for name in names:
+            try:
+                shard_collections[name] = self.client.get_collection(name)
+                shard_by = (shard_collections[name].metadata or {}).get("shard_by", shard_by)
+            except Exception as e:
+                print(f"Shard {name} not found: {str(e)}")
+        if shard_collections:
+            print(f"Loaded {len(shard_collections)} shards for collection: {self.collection_name}")
+        # The unsharded collection is still searched when it holds chunks from before sharding
+        search_base = not shard_collections or self.collection.count() > 0
+        self.shard_collections, self.shard_by, self.search_base = shard_collections, shard_by, search_base
+        # Similarities are only comparable across queries (and thresholds meaningful)
+        # when every searched collection is in cosine or inner product space
+        targets = list(shard_collections.values()) + ([self.collection] if search_base else [])
+        spaces = {distance_space(collection) for collection in targets}
+        self.calibrated = bool(spaces) and spaces <= {"cosine", "ip"}
+        if not self.calibrated:
+            print("Index is not in cosine space, run vector_store.py again for calibrated similarity scores")
 
-    def similarity_search(self, query, k=None):
+    def target_collections(self, shards=None, filters=None):
+        self.reload_if_changed()
+        if shards is not None:
+            names = [shard_collection_name(self.collection_name, shard) for shard in shards]
+            return [self.shard_collections[name] for name in names if name in self.shard_collections]
+        targets = list(self.shard_collections.values())
+        file_names = as_list((filters or {}).get("file_name"))
+        if file_names and self.shard_by == "file_name":
+            # Index is sharded per video, so a file_name filter only needs those shards
+            names = [shard_collection_name(self.collection_name, name) for name in file_names]
+            targets = [self.shard_collections[name] for name in names if name in self.shard_collections]
+        if self.collection is not None and self.search_base:
+            targets.append(self.collection)
+        return targets
+
+    def health(self):
+        self.reload_if_changed()
+        status = {
+            "collection": self.collection_name,
+            "connected": self.collection is not None,
+            "embedding_model": model_state,
+            "embedding_cache": query_cache.stats(),
+            "index_version": self.index_version(),
+            "calibrated": self.calibrated,
+        }
+        if self.collection is not None:
+            try:
+                status["chunks"] = self.collection.count() + sum(c.count() for c in self.shard_collections.values())
+            except Exception as e:
+                status["connected"] = False
+                status["error"] = str(e)
+        status["shards"] = len(self.shard_collections)
+        status["videos"] = self.video_collection.count() if self.video_collection is not None else 0
+        lexical_index = self.get_lexical_index()
+        binary_index = self.get_binary_index()
+        status["lexical_chunks"] = len(lexical_index) if lexical_index is not None else 0
+        status["binary_chunks"] = len(binary_index) if binary_index is not None else 0
+        return status
+
+    def index_version(self):
+        return read_index_version(self.chroma_db_dir)
+
+    def close(self):
+        executor = self.lazy_objects.get("thread pool")
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    @staticmethod
+    def make_hit(chunk_id, text, meta, similarity):
+        return {
+            "id": chunk_id,
+            "text": text,
+            "start_time": meta.get("start_time"),
+            "end_time": meta.get("end_time"),
+            "file_name": meta.get("file_name"),
+            "similarity": similarity
+        }
+
+    def query_collection(self, collection, query_embedding, k, where=None, with_embeddings=False):
+        return self.query_collection_batch(collection, [query_embedding], k, where, with_embeddings)[0]
+
+    def query_collection_batch(self, collection, query_embeddings, k, where=None, with_embeddings=False):
+        # One query call scores every embedding, results come back as one row per query
+        include = ['metadatas', 'documents', 'distances'] + (['embeddings'] if with_embeddings else [])
+        results = collection.query(
+            query_embeddings=[np.asarray(embedding).tolist() for embedding in query_embeddings],
+            n_results=k,
+            where=where,
+            include=include
+        )
+        
+        space = distance_space(collection)
+        rows = []
+        for row in range(len(query_embeddings)):
+            hits = []
+            if results and 'ids' in results and len(results['ids']) > row:
+                for i in range(len(results['ids'][row])):
+                    meta = results['metadatas'][row][i]
+                    text = results['documents'][row][i]
+                    distance = results['distances'][row][i]
+                    hit = self.make_hit(results['ids'][row][i], text, meta, distance_to_similarity(distance, space))
+                    if with_embeddings:
+                        hit["embedding"] = np.asarray(results['embeddings'][row][i])
+                    hits.append(hit)
+            rows.append(hits)
+        return rows
+
+    def search_by_embedding(self, query_embedding, k, shards=None, filters=None, with_embeddings=False):
+        where = build_where(filters)
+        targets = self.target_collections(shards, filters)
+        if len(targets) <= 1:
+            return self.query_collection(targets[0], query_embedding, k, where, with_embeddings) if targets else []
+
+        # Fan the query out to every shard in parallel, then merge the per-shard
+        # top-k lists (each already sorted by similarity) with a heap
+        futures = [
+            self.get_executor().submit(self.query_collection, collection, query_embedding, k, where, with_embeddings)
+            for collection in targets
+        ]
+        return merge_hits([future.result() for future in futures], k)
+
+    def search_by_embeddings(self, query_embeddings, k, shards=None, filters=None, with_embeddings=False):
+        """search_by_embedding for many queries: one multi-row query per collection."""
+        where = build_where(filters)
+        targets = self.target_collections(shards, filters)
+        if not targets or not len(query_embeddings):
+            return [[] for _ in query_embeddings]
+        if len(targets) == 1:
+            return self.query_collection_batch(targets[0], query_embeddings, k, where, with_embeddings)
+
+        futures = [
+            self.get_executor().submit(self.query_collection_batch, collection, query_embeddings, k, where, with_embeddings)
+            for collection in targets
+        ]
+        shard_rows = [future.result() for future in futures]
+        results = []
+        for row in range(len(query_embeddings)):
+            results.append(merge_hits([hits[row] for hits in shard_rows], k))
+        return results
+
+    def batch_search(self, queries, k=None, search_type="similarity", shards=None, filters=None, rrf_k=60,
+                     lambda_mult=0.5, duplicate_threshold=None):
+        """Retrieve for many queries at once, returning one hit list per query.
+
+        Queries are embedded in batched forward passes and scored with one
+        vector query per collection. For search_type="hybrid" the BM25
+        searches run on the executor and are fused per query like hybrid_search,
+        search_type="mmr" diversifies each row like max_marginal_relevance_search.
+        """
+        if k is None:
+            k = self.default_k
+        if self.collection is None:
+            print("Warning: ChromaDB collection not available. Returning empty results.")
+            return [[] for _ in queries]
+
+        try:
+            query_embeddings = embed_queries(queries)
+            if search_type == "mmr":
+                rows = self.search_by_embeddings(query_embeddings, max(k * 4, 20), shards, filters, with_embeddings=True)
+                return [
+                    [{key: value for key, value in hit.items() if key != "embedding"}
+                     for hit in mmr_select(embedding, hits, k, lambda_mult, duplicate_threshold)]
+                    for embedding, hits in zip(query_embeddings, rows)
+                ]
+            if search_type != "hybrid":
+                return self.search_by_embeddings(query_embeddings, k, shards, filters)
+
+            fetch_k = max(k * 4, 20)
+            lexical_futures = [
+                self.get_executor().submit(self.lexical_search, query, fetch_k, shards, filters, embedding)
+                for query, embedding in zip(queries, query_embeddings)
+            ]
+            vector_rows = self.search_by_embeddings(query_embeddings, fetch_k, shards, filters)
+            results = []
+            for vector_hits, future in zip(vector_rows, lexical_futures):
+                lexical_hits = future.result()
+                if not lexical_hits:
+                    results.append(vector_hits[:k])
+                else:
+                    results.append(reciprocal_rank_fusion([vector_hits, lexical_hits], k, rrf_k))
+            return results
+        except Exception as e:
+            print(f"Error in batch search: {str(e)}")
+            return [[] for _ in queries]
+
+    def multi_query_search(self, queries, k=None, shards=None, filters=None, fusion="rrf", search_type="similarity",
+                           fetch_k=None, rrf_k=60, lambda_mult=0.5, duplicate_threshold=None):
+        """Search several phrasings of one question together and return a single fused top-k.
+
+        All queries are embedded in one batch and scored in one vector query
+        per collection. Hits are de-duplicated by chunk id and combined with
+        reciprocal rank fusion (fusion="rrf") or by their best similarity
+        (fusion="max"). search_type="hybrid" adds each query's BM25 hits,
+        search_type="mmr" picks k diverse hits from the fused candidates
+        relative to the first query. Other search types raise ValueError.
+        """
+        if search_type not in multi_query_types:
+            raise ValueError(f"search_type '{search_type}' does not support multiple queries")
+        if k is None:
+            k = self.default_k
+        if fetch_k is None:
+            fetch_k = max(k * 2, 10)
+        queries = [query for query in dict.fromkeys(queries) if query and query.strip()]
+        if self.collection is None or not queries:
+            return []
+
+        try:
+            query_embeddings = embed_queries(queries)
+            lexical_futures = []
+            if search_type == "hybrid":
+                lexical_futures = [
+                    self.get_executor().submit(self.lexical_search, query, fetch_k, shards, filters, embedding)
+                    for query, embedding in zip(queries, query_embeddings)
+                ]
+            with_embeddings = search_type == "mmr"
+            result_lists = self.search_by_embeddings(query_embeddings, fetch_k, shards, filters, with_embeddings)
+            result_lists += [future.result() for future in lexical_futures]
+            fused_k = fetch_k if with_embeddings else k
+            if fusion == "max":
+                fused = max_score_fusion(result_lists, fused_k)
+            else:
+                fused = reciprocal_rank_fusion(result_lists, fused_k, rrf_k)
+            if not with_embeddings:
+                return fused
+            selected = mmr_select(query_embeddings[0], fused, k, lambda_mult, duplicate_threshold)
+            return [{key: value for key, value in hit.items() if key != "embedding"} for hit in selected]
+        except Exception as e:
+            print(f"Error in multi-query search: {str(e)}")
+            return []
+
+    def similarity_search(self, query, k=None, shards=None, filters=None):
+        """Return the k most similar chunks to query.
+
+        filters restricts the candidates before the vector scan, e.g.
+        {"file_name": "lecture3.mp4", "time_range": (60, 300), "tags": ["intro"]}.
+        """
         if k is None:
             k = self.default_k
             
@@ -82,47 +663,212 @@ class ChromaRetriever:
             return []
             
         try:
-            query_embedding = embed_text(query)
-            results = self.collection.query(
-                query_embeddings=[query_embedding],
-                n_results=k,
-                include=['metadatas', 'documents', 'distances']
-            )
-            
-            hits = []
-            if results and 'ids' in results and len(results['ids']) > 0:
-                for i in range(len(results['ids'][0])):
-                    meta = results['metadatas'][0][i]
-                    text = results['documents'][0][i]
-                    distance = results['distances'][0][i]
-                    hits.append({
-                        "text": text,
-                        "start_time": meta.get("start_time"),
-                        "end_time": meta.get("end_time"),
-                        "file_name": meta.get("file_name"),
-                        "similarity": 1 - distance  
-                    })
-            return hits
+            query_embedding = embed_query(query)
+            return self.search_by_embedding(query_embedding, k, shards, filters)
         except Exception as e:
             print(f"Error in similarity search: {str(e)}")
             return []
 
+    def search_videos(self, query, k=3, filters=None):
+        """Return the k videos whose summaries best match query, as hits whose text is the summary."""
+        self.reload_if_changed()
+        if self.video_collection is None:
+            return []
+        try:
+            file_names = as_list((filters or {}).get("file_name"))
+            where = build_where({"file_name": file_names}) if file_names else None
+            return self.query_collection(self.video_collection, embed_query(query), k, where)
+        except Exception as e:
+            print(f"Error in video search: {str(e)}")
+            return []
+
+    def coarse_to_fine_search(self, query, k=None, videos=3, shards=None, filters=None):
+        """Pick the best matching videos from the video index, then search only their chunks."""
+        if k is None:
+            k = self.default_k
+        self.reload_if_changed()
+        if self.video_collection is None or (filters or {}).get("file_name"):
+            return self.similarity_search(query, k, shards, filters)
+
+        top_videos = self.search_videos(query, videos)
+        if not top_videos:
+            return self.similarity_search(query, k, shards, filters)
+        narrowed = {**(filters or {}), "file_name": [video["file_name"] for video in top_videos]}
+        return self.similarity_search(query, k, shards, narrowed)
+
+    def max_marginal_relevance_search(self, query, k=None, fetch_k=20, lambda_mult=0.5, duplicate_threshold=None,
+                                      shards=None, filters=None):
+        """Vector search for fetch_k candidates, then keep k diverse ones with MMR.
+
+        lambda_mult=1 is plain relevance order, lower values favour hits that
+        differ from the ones already picked. duplicate_threshold (cosine, e.g.
+        0.95) drops near-identical chunks such as overlapping windows.
+        """
+        if k is None:
+            k = self.default_k
+        if self.collection is None:
+            print("Warning: ChromaDB collection not available. Returning empty results.")
+            return []
+
+        try:
+            query_embedding = embed_query(query)
+            candidates = self.search_by_embedding(query_embedding, max(fetch_k, k), shards, filters, with_embeddings=True)
+            selected = mmr_select(query_embedding, candidates, k, lambda_mult, duplicate_threshold)
+            return [{key: value for key, value in hit.items() if key != "embedding"} for hit in selected]
+        except Exception as e:
+            print(f"Error in MMR search: {str(e)}")
+            return []
+
+    def allowed_ids(self, shards=None, filters=None):
+        """Ids of the chunks a filtered or shard-restricted search may return, None when unrestricted.
+
+        Side indexes (BM25, binary codes) cover the whole library, so they are
+        restricted to these ids before scoring instead of filtering their top-k.
+        """
+        if not filters and shards is None:
+            return None
+        where = build_where(filters)
+        allowed = set()
+        for collection in self.target_collections(shards, filters):
+            allowed.update(collection.get(where=where, include=[])["ids"])
+        return allowed
+
+    def hits_for_ids(self, scores, k, score_field, shards=None, filters=None, query_embedding=None):
+        """Look up scored chunk ids in the searched collections, returns the k best hits by score.
+
+        Each hit keeps its score under score_field. With query_embedding the
+        similarity is computed from the stored embedding. Ids excluded by the
+        filters or shard selection are dropped.
+        """
+        where = build_where(filters)
+        include = ['metadatas', 'documents'] + (['embeddings'] if query_embedding is not None else [])
+        hits = {}
+        for collection in self.target_collections(shards, filters):
+            found = collection.get(ids=list(scores), where=where, include=include)
+            for i, chunk_id in enumerate(found['ids']):
+                similarity = None
+                if query_embedding is not None and found.get('embeddings') is not None:
+                    cosine = float(np.dot(normalize(found['embeddings'][i]), normalize(query_embedding)))
+                    similarity = min(1.0, max(0.0, cosine))
+                hit = self.make_hit(chunk_id, found['documents'][i], found['metadatas'][i], similarity)
+                hit[score_field] = scores[chunk_id]
+                hits[chunk_id] = hit
+        return sorted(hits.values(), key=lambda hit: hit[score_field], reverse=True)[:k]
+
+    def lexical_search(self, query, k=None, shards=None, filters=None, query_embedding=None):
+        """BM25 search over the chunk texts, hits are looked up in the vector store by id."""
+        if k is None:
+            k = self.default_k
+        lexical_index = self.get_lexical_index()
+        if self.collection is None or lexical_index is None:
+            return []
+
+        try:
+            scored = lexical_index.search(query, k, self.allowed_ids(shards, filters))
+            if not scored:
+                return []
+            return self.hits_for_ids(dict(scored), k, "bm25_score", shards, filters, query_embedding)
+        except Exception as e:
+            print(f"Error in lexical search: {str(e)}")
+            return []
+
+    def compressed_search(self, query, k=None, shards=None, filters=None, candidates=None):
+        """Scan the binary sign codes of all chunks, rescore the best candidates with full vectors.
+
+        Falls back to similarity_search while the binary index is empty.
+        """
+        if k is None:
+            k = self.default_k
+        if self.collection is None:
+            print("Warning: ChromaDB collection not available. Returning empty results.")
+            return []
+        binary_index = self.get_binary_index()
+        if binary_index is not None:
+            # Pick up an index written by vector_store.py after startup
+            binary_index.reload_if_changed()
+        if binary_index is None or not len(binary_index):
+            return self.similarity_search(query, k=k, shards=shards, filters=filters)
+
+        try:
+            allowed = self.allowed_ids(shards, filters)
+            scored = {
+                chunk_id: min(1.0, max(0.0, score))
+                for chunk_id, score in binary_index.search(embed_query(query), k, candidates, allowed)
+            }
+            if not scored:
+                return []
+            return self.hits_for_ids(scored, k, "similarity", shards, filters)
+        except Exception as e:
+            print(f"Error in compressed search: {str(e)}")
+            return []
+
+    def hybrid_search(self, query, k=None, shards=None, filters=None, fetch_k=None, rrf_k=60):
+        """Run BM25 and vector search concurrently and fuse them with reciprocal rank fusion."""
+        if k is None:
+            k = self.default_k
+        if fetch_k is None:
+            fetch_k = max(k * 4, 20)
+        if self.collection is None:
+            print("Warning: ChromaDB collection not available. Returning empty results.")
+            return []
+
+        try:
+            query_embedding = embed_query(query)
+            lexical_future = self.get_executor().submit(
+                self.lexical_search, query, fetch_k, shards, filters, query_embedding
+            )
+            vector_hits = self.search_by_embedding(query_embedding, fetch_k, shards, filters)
+            lexical_hits = lexical_future.result()
+            if not lexical_hits:
+                return vector_hits[:k]
+            return reciprocal_rank_fusion([vector_hits, lexical_hits], k, rrf_k)
+        except Exception as e:
+            print(f"Error in hybrid search: {str(e)}")
+            return []
+
     def as_retriever(self, search_type="similarity", search_kwargs=None):
-        def retriever(query, k=None):
+        def retriever(query, k=None, shards=None, filters=None):
             if k is not None:
                 num_results = k
             elif search_kwargs and "k" in search_kwargs:
                 num_results = search_kwargs["k"]
             else:
                 num_results = self.default_k
-            results = self.similarity_search(query, k=num_results)
+            if shards is None and search_kwargs:
+                shards = search_kwargs.get("shards")
+            if filters is None and search_kwargs:
+                filters = search_kwargs.get("filters")
+            if isinstance(query, (list, tuple)):
+                # A list of rewrites or sub-questions is searched together and fused
+                kwargs = search_kwargs or {}
+                return self.multi_query_search(query, k=num_results, shards=shards, filters=filters,
+                                               fusion=kwargs.get("fusion", "rrf"), search_type=search_type,
+                                               lambda_mult=kwargs.get("lambda_mult", 0.5),
+                                               duplicate_threshold=kwargs.get("duplicate_threshold"))
+            if search_type == "hybrid":
+                return self.hybrid_search(query, k=num_results, shards=shards, filters=filters)
+            if search_type == "compressed":
+                candidates = (search_kwargs or {}).get("candidates")
+                return self.compressed_search(query, k=num_results, shards=shards, filters=filters,
+                                              candidates=candidates)
+            if search_type == "coarse":
+                videos = (search_kwargs or {}).get("videos", 3)
+                return self.coarse_to_fine_search(query, k=num_results, videos=videos, shards=shards, filters=filters)
+            if search_type == "mmr":
+                kwargs = search_kwargs or {}
+                return self.max_marginal_relevance_search(
+                    query, k=num_results,
+                    fetch_k=kwargs.get("fetch_k", max(num_results * 4, 20)),
+                    lambda_mult=kwargs.get("lambda_mult", 0.5),
+                    duplicate_threshold=kwargs.get("duplicate_threshold"),
+                    shards=shards, filters=filters
+                )
+            results = self.similarity_search(query, k=num_results, shards=shards, filters=filters)
             return results 
         return retriever
 
-# Initialize the retriever chain
-retriever_chain = ChromaRetriever().as_retriever(search_kwargs={"k": 5})
-
 if __name__ == "__main__":
+    retriever_chain = ChromaRetriever().as_retriever(search_kwargs={"k": 5})
     query = "Please provide information about video content."
     results = retriever_chain(query, k=5)
     for i, chunk in enumerate(results, 1):
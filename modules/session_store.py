@@ -0,0 +1,122 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+
+class SessionStore:
+    """Chat history kept server-side, keyed by a client generated session id.
+
+    Sessions live in an in-memory LRU with a TTL that is refreshed on every
+    turn. With db_path set they are also written to SQLite, so history
+    survives restarts and sessions evicted from memory are reloaded on demand.
+    Only the last max_messages messages of a session are kept; the prompt
+    builder compacts them further before they reach the LLM.
+    """
+
+    def __init__(self, maxsize=1024, ttl=3600, max_messages=100, db_path=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_messages = max_messages
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.db = None
+        if db_path:
+            os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+            self.db = sqlite3.connect(db_path, check_same_thread=False)
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS sessions (session_id TEXT PRIMARY KEY, history TEXT, updated REAL)"
+            )
+            self.db.commit()
+
+    def load(self, session_id, now):
+        if self.db is None:
+            return None
+        row = self.db.execute(
+            "SELECT history, updated FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        if now - row[1] > self.ttl:
+            self.db.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            self.db.commit()
+            return None
+        return json.loads(row[0])
+
+    def get(self, session_id):
+        now = time.time()
+        with self.lock:
+            entry = self.sessions.get(session_id)
+            if entry is not None and now - entry[0] > self.ttl:
+                del self.sessions[session_id]
+                entry = None
+            if entry is not None:
+                self.sessions.move_to_end(session_id)
+                self.hits += 1
+                return list(entry[1])
+            history = self.load(session_id, now)
+            if history is None:
+                self.misses += 1
+                return []
+            self.hits += 1
+            self.put(session_id, history, now)
+            return list(history)
+
+    def put(self, session_id, history, now):
+        self.sessions[session_id] = (now, history)
+        self.sessions.move_to_end(session_id)
+        while len(self.sessions) > self.maxsize:
+            self.sessions.popitem(last=False)
+
+    def append(self, session_id, *messages):
+        now = time.time()
+        with self.lock:
+            entry = self.sessions.get(session_id)
+            if entry is not None and now - entry[0] <= self.ttl:
+                history = entry[1]
+            else:
+                history = self.load(session_id, now) or []
+            history = (history + list(messages))[-self.max_messages:]
+            self.put(session_id, history, now)
+            if self.db is not None:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO sessions (session_id, history, updated) VALUES (?, ?, ?)",
+                    (session_id, json.dumps(history), now)
+                )
+                self.db.commit()
+
+    def delete(self, session_id):
+        with self.lock:
+            found = self.sessions.pop(session_id, None) is not None
+            if self.db is not None:
+                found = self.db.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,)).rowcount > 0 or found
+                self.db.commit()
+            return found
+
+    def stats(self):
+        return {
+            "size": len(self.sessions),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "persistent": self.db is not None
+        }
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+
+def build_session_store():
+    return SessionStore(
+        maxsize=int(os.getenv("SESSION_STORE_SIZE", "1024")),
+        ttl=float(os.getenv("SESSION_TTL", "3600")),
+        max_messages=int(os.getenv("SESSION_MAX_MESSAGES", "100")),
+        # e.g. ../data/db/sessions.sqlite3 to keep sessions across restarts
+        db_path=os.getenv("SESSION_DB_PATH") or None
+    )
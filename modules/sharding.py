@@ -0,0 +1,50 @@
+import re
+import hashlib
+
+SHARD_SEPARATOR = "__"
+
+
+def shard_key(chunk, shard_by):
+    """Return the shard a chunk belongs to, or None when the index is not sharded.
+
+    shard_by can be a metadata field name ("file_name", "tenant", ...), the special
+    value "ingest_month" for time-range shards, a dict mapping file_name -> group
+    for video groups, or a callable taking the chunk.
+    """
+    if shard_by is None:
+        return None
+    if callable(shard_by):
+        key = shard_by(chunk)
+    elif isinstance(shard_by, dict):
+        key = shard_by.get(chunk.get("file_name"), "default")
+    elif shard_by == "ingest_month":
+        ingested_at = chunk.get("ingested_at")
+        if not ingested_at:
+            # A fallback to the current time would copy re-ingested chunks into a new shard every month
+            raise ValueError("ingest_month sharding needs an 'ingested_at' timestamp on every chunk")
+        key = str(ingested_at)[:7]
+    else:
+        key = chunk.get(shard_by)
+    if key is None or str(key).strip() == "":
+        key = "default"
+    return str(key)
+
+
+def shard_collection_name(collection_name, shard):
+    # Chroma collection names must be 3-63 chars of [a-zA-Z0-9._-] and start/end alphanumeric
+    safe = re.sub(r"[^a-zA-Z0-9_-]+", "-", str(shard)).strip("-_") or "default"
+    name = f"{collection_name}{SHARD_SEPARATOR}{safe}"
+    if len(name) > 63:
+        digest = hashlib.sha1(str(shard).encode()).hexdigest()[:8]
+        name = f"{name[:54]}-{digest}"
+    return name
+
+
+def collection_names(client):
+    # list_collections returns names on some chromadb versions and Collection objects on others
+    return [getattr(c, "name", c) for c in client.list_collections()]
+
+
+def list_shards(client, collection_name):
+    prefix = f"{collection_name}{SHARD_SEPARATOR}"
+    return sorted(name for name in collection_names(client) if name.startswith(prefix))
@@ -0,0 +1,63 @@
+def merge_text(left, right, min_overlap=10, max_overlap=400):
+    """Join two chunk texts, writing the text they overlap on only once."""
+    if right in left:
+        return left
+    if left in right:
+        return right
+    for length in range(min(len(left), len(right), max_overlap), min_overlap - 1, -1):
+        if left.endswith(right[:length]):
+            return left + right[length:]
+    return f"{left} {right}"
+
+
+def stitch_chunks(chunks, max_gap=1.0):
+    """Merge hits from the same video whose time ranges overlap or are within max_gap seconds.
+
+    Each merged hit covers the union of its members' time ranges, keeps the
+    best similarity/score of its members and lists them in "merged_ids".
+    Results stay in the order of each group's best ranked member.
+    """
+    by_file = {}
+    for rank, chunk in enumerate(chunks):
+        by_file.setdefault(chunk.get("file_name"), []).append((rank, chunk))
+
+    merged = []
+    for members in by_file.values():
+        members.sort(key=lambda member: (member[1].get("start_time") or 0, member[1].get("end_time") or 0))
+        group = [members[0]]
+        group_end = members[0][1].get("end_time") or 0
+        for rank, chunk in members[1:]:
+            if (chunk.get("start_time") or 0) <= group_end + max_gap:
+                group.append((rank, chunk))
+            else:
+                merged.append(merge_group(group))
+                group = [(rank, chunk)]
+            group_end = max(group_end if len(group) > 1 else 0, chunk.get("end_time") or 0)
+        merged.append(merge_group(group))
+
+    merged.sort(key=lambda item: item[0])
+    return [chunk for _, chunk in merged]
+
+
+def merge_group(group):
+    best_rank = min(rank for rank, _ in group)
+    if len(group) == 1:
+        return best_rank, group[0][1]
+
+    chunks = [chunk for _, chunk in group]
+    best = dict(group[[rank for rank, _ in group].index(best_rank)][1])
+    text = chunks[0]["text"]
+    for chunk in chunks[1:]:
+        text = merge_text(text, chunk["text"])
+    best.update({
+        "id": "+".join(sorted(chunk["id"] for chunk in chunks)),
+        "merged_ids": [chunk["id"] for chunk in chunks],
+        "text": text,
+        "start_time": min(chunk.get("start_time") or 0 for chunk in chunks),
+        "end_time": max(chunk.get("end_time") or 0 for chunk in chunks),
+    })
+    for field in ("similarity", "score", "rerank_score"):
+        values = [chunk[field] for chunk in chunks if chunk.get(field) is not None]
+        if values:
+            best[field] = max(values)
+    return best_rank, best
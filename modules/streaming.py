@@ -0,0 +1,147 @@
+import json
+import asyncio
+
+
+def sse_event(payload):
+    return f"data: {json.dumps(payload)}\n\n"
+
+
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
+
+
+def partial_tag_length(text, tag):
+    # Length of the longest suffix of text that is a proper prefix of tag
+    for length in range(min(len(tag) - 1, len(text)), 0, -1):
+        if text.endswith(tag[:length]):
+            return length
+    return 0
+
+
+class ThinkFilter:
+    """Removes <think>...</think> blocks from text that arrives in pieces.
+
+    Tags may be split across any number of tokens: at most len("</think>") - 1
+    characters are held back while a tag might be starting, so each token is
+    processed in time proportional to its own length. Leading whitespace of
+    the visible output is dropped, like the .strip() the regex version did.
+    """
+
+    def __init__(self):
+        self.inside = False
+        self.pending = ""
+        self.started = False
+
+    def feed(self, token):
+        text = self.pending + token
+        self.pending = ""
+        visible = []
+        while text:
+            tag = THINK_CLOSE if self.inside else THINK_OPEN
+            index = text.find(tag)
+            if index >= 0:
+                if not self.inside:
+                    visible.append(text[:index])
+                text = text[index + len(tag):]
+                self.inside = not self.inside
+                continue
+            keep = partial_tag_length(text, tag)
+            if not self.inside:
+                visible.append(text[:len(text) - keep])
+            self.pending = text[len(text) - keep:]
+            break
+        return self.emit("".join(visible))
+
+    def flush(self):
+        # An unterminated think block is reasoning too, so it is never released
+        rest = "" if self.inside else self.pending
+        self.pending = ""
+        return self.emit(rest)
+
+    def emit(self, text):
+        if not self.started:
+            text = text.lstrip()
+            self.started = bool(text)
+        return text
+
+
+def strip_think(text):
+    think_filter = ThinkFilter()
+    return (think_filter.feed(text) + think_filter.flush()).strip()
+
+
+async def filter_think(tokens):
+    """Yield only the visible part of a token stream."""
+    think_filter = ThinkFilter()
+    async for token in tokens:
+        visible = think_filter.feed(token)
+        if visible:
+            yield visible
+    rest = think_filter.flush()
+    if rest:
+        yield rest
+
+
+async def coalesce_tokens(tokens, max_delay=0.03, max_chars=64):
+    """Group streamed tokens into larger frames to cut the number of SSE writes.
+
+    The first token is passed through immediately so time-to-first-token is
+    unaffected. After that, tokens are buffered until max_chars characters are
+    pending or max_delay seconds have passed since the oldest buffered token,
+    whichever comes first. max_delay <= 0 disables coalescing.
+    """
+    if max_delay <= 0:
+        async for token in tokens:
+            yield token
+        return
+
+    loop = asyncio.get_running_loop()
+    iterator = tokens.__aiter__()
+    buffer = []
+    size = 0
+    deadline = None
+    first = True
+    pending = None
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(iterator.__anext__())
+            timeout = None if deadline is None else max(0.0, deadline - loop.time())
+            done, _ = await asyncio.wait({pending}, timeout=timeout)
+            if not done:
+                # Deadline passed while waiting for the next token, send what we have
+                yield "".join(buffer)
+                buffer, size, deadline = [], 0, None
+                continue
+
+            task, pending = pending, None
+            try:
+                token = task.result()
+            except StopAsyncIteration:
+                break
+
+            if first:
+                first = False
+                yield token
+                continue
+            buffer.append(token)
+            size += len(token)
+            if deadline is None:
+                deadline = loop.time() + max_delay
+            if size >= max_chars:
+                yield "".join(buffer)
+                buffer, size, deadline = [], 0, None
+
+        if buffer:
+            yield "".join(buffer)
+    finally:
+        if pending is not None:
+            pending.cancel()
+
+
+async def stream_message(message, metadata=None):
+    """Stream a canned response as a single token frame followed by the end frame."""
+    if metadata is not None:
+        yield sse_event({'metadata': metadata})
+    yield sse_event({'token': message})
+    yield sse_event({'end': True, 'complete_response': message})
@@ -1,24 +1,43 @@
 import os
 import json
+from datetime import datetime
+import hashlib
+import argparse
 import torch
 import chromadb
 from chromadb.config import Settings
 from chromadb.utils import embedding_functions
 import numpy as np
 from transformers import AutoTokenizer, AutoModel
+from sharding import shard_key, shard_collection_name, collection_names, list_shards
+from metadata_filters import tag_metadata
+from lexical_index import LexicalIndex, bm25_dir
+from index_version import bump_index_version
+from retriever import collection_metadata, distance_space
+from video_index import build_video_index
+from binary_index import BinaryIndex, binary_dir
 
 chukns_dir = "../data/chunks"
+# Chroma caps the ids per request, stale copies are deleted in slices of this size
+delete_batch_size = 5000
 chroma_dir = "../data/db/chroma_db"
 collection_name = "video_chunks"
+# chunk id -> collection it was last stored in, kept next to the Chroma files
+placements_file = "placements.json"
 
 def load_chunks(chunks_dir):
     chunks = []
     for file_name in os.listdir(chunks_dir):
         if file_name.endswith(".json"):
             file_path = os.path.join(chunks_dir, file_name)
+            # Chunks without an ingest time get their file's mtime, so ingest_month
+            # shards stay stable when the same files are ingested again
+            ingested_at = datetime.fromtimestamp(os.path.getmtime(file_path)).isoformat()
             with open(file_path, "r", encoding="utf-8") as f:
                 data = json.load(f)
                 if isinstance(data, list):
+                    for chunk in data:
+                        chunk.setdefault("ingested_at", ingested_at)
                     chunks.extend(data)
     return chunks
 
@@ -31,15 +50,130 @@ def load_embeddings(embeddings_path):
     else:
         raise ValueError("Unsupported embeddings file format.")
 
-def main():
-    chunks = load_chunks(chukns_dir)
-    print(f"Loaded {len(chunks)} chunks.")
+def chunk_id(chunk):
+    # Stable ids let a single shard be rebuilt without renumbering the others
+    raw = f"{chunk.get('file_name')}|{chunk.get('start_time')}|{chunk.get('end_time')}|{chunk.get('text')}"
+    return f"chunk_{hashlib.sha1(raw.encode('utf-8')).hexdigest()[:16]}"
+
+def group_by_shard(chunks, embeddings, shard_by=None):
+    groups = {}
+    for chunk, embedding in zip(chunks, embeddings):
+        key = shard_key(chunk, shard_by)
+        groups.setdefault(key, []).append((chunk, embedding))
+    return groups
+
+def target_collection_name(shard):
+    return collection_name if shard is None else shard_collection_name(collection_name, shard)
+
+def load_placements(placements_path):
+    if placements_path is None or not os.path.exists(placements_path):
+        return None
+    with open(placements_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_placements(placements_path, placements):
+    tmp_path = placements_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(placements, f)
+    os.replace(tmp_path, placements_path)
+
+def remove_stale_copies(client, placements, placements_path=None):
+    """Delete the old copy of every chunk whose collection changed since the last ingest.
+
+    A chunk lives in exactly one collection. The collection each chunk was
+    stored in is recorded in placements_path, so only moved chunks are
+    deleted. Without a record every collection of the index is swept once.
+    """
+    recorded = load_placements(placements_path)
+    existing = collection_names(client)
+    stale = {}
+    if recorded is None:
+        for name in [collection_name] + list_shards(client, collection_name):
+            if name in existing:
+                stale[name] = [chunk_id for chunk_id, target in placements.items() if target != name]
+    else:
+        for chunk_id, target in placements.items():
+            previous = recorded.get(chunk_id)
+            if previous is not None and previous != target and previous in existing:
+                stale.setdefault(previous, []).append(chunk_id)
+
+    targets = set(placements.values())
+    for name, chunk_ids in stale.items():
+        if not chunk_ids:
+            continue
+        collection = client.get_collection(name)
+        for i in range(0, len(chunk_ids), delete_batch_size):
+            collection.delete(ids=chunk_ids[i:i + delete_batch_size])
+        if name != collection_name and name not in targets and collection.count() == 0:
+            client.delete_collection(name)
+        print(f"Moved {len(chunk_ids)} chunks out of collection '{name}'.")
+
+    if placements_path is not None:
+        save_placements(placements_path, {**(recorded or {}), **placements})
+
+def store_chunks(client, chunks, embeddings, shard_by=None, placements_path=None):
+    groups = group_by_shard(chunks, embeddings, shard_by)
+    remove_stale_copies(client, {
+        chunk_id(chunk): target_collection_name(shard) for shard, items in groups.items() for chunk, _ in items
+    }, placements_path)
+    for shard, items in groups.items():
+        name = target_collection_name(shard)
+        if shard is None:
+            collection = client.get_or_create_collection(name, metadata=collection_metadata)
+        else:
+            shard_field = shard_by if isinstance(shard_by, str) else "group"
+            collection = client.get_or_create_collection(
+                name, metadata={"shard_by": shard_field, "shard": shard, **collection_metadata}
+            )
+
+        # Identical chunks map to the same id, keep one of each
+        unique = {chunk_id(chunk): (chunk, embedding) for chunk, embedding in items}
+        metadatas = [
+            {
+                "start_time": chunk.get("start_time"),
+                "end_time": chunk.get("end_time"),
+                "text": chunk.get("text"),
+                "file_name": chunk.get("file_name"),
+                **tag_metadata(chunk.get("tags"))
+            }
+            for chunk, _ in unique.values()
+        ]
+        collection.upsert(
+            embeddings=[embedding for _, embedding in unique.values()],
+            metadatas=metadatas,
+            ids=list(unique.keys()),
+            documents=[chunk["text"] for chunk, _ in unique.values()]
+        )
+        print(f"Stored {len(unique)} embeddings in ChromaDB collection '{name}'.")
 
-    model_name = "sentence-transformers/all-MiniLM-L6-v2"
+def drop_legacy_collections(client):
+    # The distance space of a collection is fixed at creation, so collections from
+    # before the switch to cosine are dropped and rebuilt from the chunk files
+    existing = collection_names(client)
+    for name in [collection_name] + list_shards(client, collection_name):
+        if name not in existing:
+            continue
+        if distance_space(client.get_collection(name)) != collection_metadata["hnsw:space"]:
+            print(f"Recreating collection '{name}' in {collection_metadata['hnsw:space']} space.")
+            client.delete_collection(name)
+
+def rebuild_shard(client, shard, chunks, embeddings, shard_by, placements_path=None):
+    name = shard_collection_name(collection_name, shard)
+    if name in collection_names(client):
+        client.delete_collection(name)
+    selected = [
+        (chunk, embedding) for chunk, embedding in zip(chunks, embeddings)
+        if shard_key(chunk, shard_by) == shard
+    ]
+    if not selected:
+        print(f"No chunks belong to shard '{shard}'.")
+        return
+    store_chunks(client, [c for c, _ in selected], [e for _, e in selected], shard_by, placements_path)
+
+def embed_chunks(texts, model_name="sentence-transformers/all-MiniLM-L6-v2", batch_size=32):
     tokenizer = AutoTokenizer.from_pretrained(model_name)
     model = AutoModel.from_pretrained(model_name)
 
-    texts = [chunk["text"] for chunk in chunks]
     # all_embeddings = []
     # for text in texts:
     #     inputs = tokenizer(text, return_tensors="pt", truncation=True, padding=True)
@@ -47,46 +181,56 @@ def main():
     #         outputs = model(**inputs)
     #         embedding = outputs.last_hidden_state.mean(dim=1).cpu().numpy()[0]
     #         all_embeddings.append(embedding)
-    batch_size = 32
     all_embeddings = []
     for i in range(0, len(texts), batch_size):
         batch_texts = texts[i:i+batch_size]
         inputs = tokenizer(batch_texts, padding=True, truncation=True, return_tensors="pt")
         with torch.no_grad():
             outputs = model(**inputs)
-            embeddings = outputs.last_hidden_state.mean(dim=1).cpu().numpy()
+            # Mean over real tokens only, then unit length for the cosine index
+            mask = inputs["attention_mask"].unsqueeze(-1).to(outputs.last_hidden_state.dtype)
+            embeddings = ((outputs.last_hidden_state * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)).cpu().numpy()
+            embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
             all_embeddings.extend(embeddings)
+    return all_embeddings
+
+def main(shard_by=None, rebuild=None):
+    chunks = load_chunks(chukns_dir)
+    print(f"Loaded {len(chunks)} chunks.")
+    if rebuild is not None:
+        chunks = [chunk for chunk in chunks if shard_key(chunk, shard_by) == rebuild]
+        print(f"Rebuilding shard '{rebuild}' from {len(chunks)} chunks.")
+
+    texts = [chunk["text"] for chunk in chunks]
+    all_embeddings = embed_chunks(texts)
     print(f"Computed {len(all_embeddings)} embeddings.")
 
     client = chromadb.PersistentClient(path=chroma_dir)
-    
-    # if collection_name not in [c.name for c in client.list_collections()]:
-    #     collection = client.create_collection(collection_name)
-    # else:
-    #     collection = client.get_collection(collection_name)
-    if collection_name not in client.list_collections():
-        collection = client.create_collection(collection_name)
+    placements_path = os.path.join(chroma_dir, placements_file)
+    if rebuild is not None:
+        rebuild_shard(client, rebuild, chunks, all_embeddings, shard_by, placements_path)
     else:
-        collection = client.get_collection(collection_name)
-
-    metadatas = [
-        {
-            "start_time": chunk.get("start_time"),
-            "end_time": chunk.get("end_time"),
-            "text": chunk.get("text"),
-            "file_name": chunk.get("file_name")
-        }
-        for chunk in chunks
-    ]
-    ids = [f"chunk_{i}" for i in range(len(chunks))]
+        drop_legacy_collections(client)
+        store_chunks(client, chunks, all_embeddings, shard_by, placements_path)
+        # Coarse index: one summary and mean embedding per video
+        build_video_index(client, chunks, all_embeddings, collection_metadata)
+
+    # BM25 index over the same chunks, only chunk ids it has not seen are indexed
+    added = LexicalIndex(bm25_dir).add([chunk_id(chunk) for chunk in chunks], texts)
+    print(f"Added {added} chunks to the lexical index at '{bm25_dir}'.")
+
+    # Sign codes plus full vectors for compressed search, chunks already indexed are replaced
+    size = BinaryIndex(binary_dir).update([chunk_id(chunk) for chunk in chunks], all_embeddings)
+    print(f"Binary index at '{binary_dir}' now holds {size} chunks.")
 
-    collection.add(
-        embeddings=all_embeddings,
-        metadatas=metadatas,
-        ids=ids,
-        documents=texts  
-    )
-    print(f"Stored {len(all_embeddings)} embeddings in ChromaDB collection '{collection_name}'.")
+    # Running backends drop cached answers once they see the new version
+    bump_index_version(chroma_dir)
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Store chunk embeddings in ChromaDB")
+    parser.add_argument("--shard-by", default=None,
+                        help="Shard the index by a chunk field (e.g. file_name, tenant) or 'ingest_month'")
+    parser.add_argument("--rebuild-shard", default=None,
+                        help="Drop and rebuild only this shard, leaving the others untouched")
+    args = parser.parse_args()
+    main(shard_by=args.shard_by, rebuild=args.rebuild_shard)
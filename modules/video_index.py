@@ -0,0 +1,69 @@
+import re
+import hashlib
+import numpy as np
+
+# One entry per video: an extractive summary as the document and the mean of the
+# video's chunk embeddings as the vector
+video_collection_name = "video_summaries"
+
+
+def video_id(file_name):
+    return f"video_{hashlib.sha1(str(file_name).encode('utf-8')).hexdigest()[:16]}"
+
+
+def split_sentences(text):
+    return [sentence for sentence in re.split(r"(?<=[.!?])\s+", text.strip()) if sentence]
+
+
+def summarize_video(chunks, embeddings, max_chunks=5, max_chars=1200):
+    """Return (summary, embedding) for one video's chunks.
+
+    The summary is built from the max_chunks chunks closest to the video's
+    mean embedding, in time order, each cut to its leading sentences so the
+    whole summary stays within max_chars.
+    """
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    matrix = matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+    centroid = matrix.mean(axis=0)
+    centroid /= max(np.linalg.norm(centroid), 1e-12)
+
+    closest = np.argsort(-(matrix @ centroid))[:max_chunks]
+    picked = sorted(closest, key=lambda i: chunks[i].get("start_time") or 0)
+    budget = max_chars // len(picked)
+    parts = []
+    for i in picked:
+        text = ""
+        for sentence in split_sentences(chunks[i]["text"]):
+            if text and len(text) + len(sentence) + 1 > budget:
+                break
+            text = f"{text} {sentence}".strip()
+        parts.append(text[:budget])
+    return " ".join(parts), centroid
+
+
+def build_video_index(client, chunks, embeddings, metadata=None):
+    """Upsert a summary and a mean embedding per video into the video_summaries collection."""
+    videos = {}
+    for chunk, embedding in zip(chunks, embeddings):
+        videos.setdefault(chunk.get("file_name"), []).append((chunk, embedding))
+
+    ids, vectors, documents, metadatas = [], [], [], []
+    for file_name, items in videos.items():
+        video_chunks = [chunk for chunk, _ in items]
+        summary, embedding = summarize_video(video_chunks, [embedding for _, embedding in items])
+        ids.append(video_id(file_name))
+        vectors.append(embedding.tolist())
+        documents.append(summary)
+        metadatas.append({
+            "file_name": file_name,
+            "start_time": min(chunk.get("start_time", 0) for chunk in video_chunks),
+            "end_time": max(chunk.get("end_time", 0) for chunk in video_chunks),
+            "chunks": len(video_chunks)
+        })
+
+    if not ids:
+        return 0
+    collection = client.get_or_create_collection(video_collection_name, metadata=metadata)
+    collection.upsert(ids=ids, embeddings=vectors, documents=documents, metadatas=metadatas)
+    print(f"Stored {len(ids)} video summaries in ChromaDB collection '{video_collection_name}'.")
+    return len(ids)
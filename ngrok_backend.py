@@ -39,6 +39,7 @@ from fastapi import FastAPI, HTTPException
 from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
+from typing import Optional
 from dotenv import load_dotenv
 import pyngrok.ngrok as ngrok
 import uvicorn
@@ -49,6 +50,7 @@ import json
 
 # Import your existing modules
 from retriever import ChromaRetriever
+from session_store import build_session_store
 from groq import Groq
 
 # Load environment variables
@@ -64,6 +66,9 @@ if not NGROK_AUTH_TOKEN:
 else:
     ngrok.set_auth_token(NGROK_AUTH_TOKEN)
 
+# Chat history of each session lives here, clients only send their session id
+session_store = build_session_store()
+
 # Create FastAPI app
 app = FastAPI()
 
@@ -337,29 +342,55 @@ async def stream_greeting_response(query, chat_history=""):
         print(f"Error in greeting streaming: {str(e)}")
         yield f"data: {json.dumps({'error': str(e)})}\n\n"
 
+async def remember_stream(events, remember):
+    # Pass the SSE events through and store the final answer in the session
+    async for event in events:
+        if event.startswith("data: ") and '"end": true' in event:
+            remember(json.loads(event[len("data: "):]).get("complete_response"))
+        yield event
+
 @app.get("/")
 async def health_check():
-    return {"status": "ok", "message": "API is running"}
+    return {"status": "ok", "message": "API is running", "sessions": session_store.stats()}
 
 class QueryRequest(BaseModel):
     query: str
     chat_history: list = []
+    session_id: Optional[str] = None
     stream: bool = False
 
+@app.delete("/session/{session_id}")
+async def delete_session(session_id: str):
+    return {"session_id": session_id, "deleted": session_store.delete(session_id)}
+
 @app.post("/query")
 async def query_endpoint(request: QueryRequest):
     try:
+        chat_history = request.chat_history
+        if request.session_id:
+            chat_history = session_store.get(request.session_id) or request.chat_history
+
+        def remember(answer):
+            if not request.session_id or not answer:
+                return
+            session_store.append(
+                request.session_id,
+                {"role": "user", "content": request.query},
+                {"role": "assistant", "content": answer}
+            )
+
         route = route_query(request.query)
         print(f"Query routed to: {route}")
         
         if route == "DEFAULT":
             if request.stream:
                 return StreamingResponse(
-                    stream_greeting_response(request.query, request.chat_history),
+                    remember_stream(stream_greeting_response(request.query, chat_history), remember),
                     media_type="text/event-stream"
                 )
             else:
-                answer = get_greeting_response(request.query, request.chat_history)
+                answer = get_greeting_response(request.query, chat_history)
+                remember(answer)
                 return JSONResponse(content={
                     "answer": answer,
                     "source": None,
@@ -374,8 +405,9 @@ async def query_endpoint(request: QueryRequest):
                         yield f"data: {json.dumps({'token': char})}\n\n"
                         await asyncio.sleep(0.01)
                     yield f"data: {json.dumps({'end': True, 'complete_response': unsafe_message})}\n\n"
-                return StreamingResponse(stream_unsafe(), media_type="text/event-stream")
+                return StreamingResponse(remember_stream(stream_unsafe(), remember), media_type="text/event-stream")
             else:
+                remember(unsafe_message)
                 return JSONResponse(content={
                     "answer": unsafe_message,
                     "source": None,
@@ -405,8 +437,10 @@ async def query_endpoint(request: QueryRequest):
                             yield f"data: {json.dumps({'token': char})}\n\n"
                             await asyncio.sleep(0.01)
                         yield f"data: {json.dumps({'end': True, 'complete_response': not_found_message})}\n\n"
-                    return StreamingResponse(stream_not_found(), media_type="text/event-stream")
+                    return StreamingResponse(remember_stream(stream_not_found(), remember),
+                                             media_type="text/event-stream")
                 else:
+                    remember(not_found_message)
                     return JSONResponse(content={
                         "answer": not_found_message,
                         "source": None,
@@ -449,12 +483,14 @@ async def query_endpoint(request: QueryRequest):
                         'chunks': chunk_payload
                     }})}\n\n"
                     
-                    async for token in stream_llm_response(context, request.query, request.chat_history):
+                    async for token in stream_llm_response(context, request.query, chat_history):
                         yield token
                 
-                return StreamingResponse(stream_with_metadata(), media_type="text/event-stream")
+                return StreamingResponse(remember_stream(stream_with_metadata(), remember),
+                                         media_type="text/event-stream")
             else:
-                answer = get_llm_response(context, request.query, request.chat_history)
+                answer = get_llm_response(context, request.query, chat_history)
+                remember(answer)
                 
                 print(f"Generated answer: {answer[:100]}...")
                 
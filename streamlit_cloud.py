@@ -39,6 +39,7 @@
 
 import streamlit as st
 import requests
+import uuid
 import os
 import time
 import json
@@ -69,6 +70,16 @@ def is_api_available():
     except:
         return False
 
+# Forget the conversation here and on the backend, then start a new session
+def reset_chat():
+    if "session_id" in st.session_state:
+        try:
+            requests.delete(API_URL.replace('/query', f"/session/{st.session_state.session_id}"), timeout=5)
+        except:
+            pass
+    st.session_state.chat_history = []
+    st.session_state.session_id = str(uuid.uuid4())
+
 def handle_api_error(message="An error occurred"):
     st.error(f" {message}")
     st.info("If this is your first time running the app, please check:")
@@ -127,7 +138,7 @@ with st.sidebar:
     streaming_enabled = st.checkbox("Enable streaming", value=True, help="Show tokens as they're generated")
     
     if st.button("Clear Chat History"):
-        st.session_state.chat_history = []
+        reset_chat()
         st.rerun()
 
 st.title(" Video Knowledge Chatbot")
@@ -136,6 +147,10 @@ st.markdown("Ask me anything about your videos or any general questions!")
 if "chat_history" not in st.session_state:
     st.session_state.chat_history = []
 
+# The backend keeps the conversation for this session id, so only the new message is sent
+if "session_id" not in st.session_state:
+    st.session_state.session_id = str(uuid.uuid4())
+
 for message in st.session_state.chat_history:
     if message["role"] == "user":
         with st.chat_message("user", avatar="👤"):
@@ -178,7 +193,7 @@ def process_special_commands(query):
     query_lower = query.lower().strip()
     
     if query_lower == "clear":
-        st.session_state.chat_history = []
+        reset_chat()
         st.rerun()
         return True
     
@@ -281,7 +296,7 @@ if query:
                             API_URL,
                             json={
                                 "query": query,
-                                "chat_history": st.session_state.chat_history[:-1],
+                                "session_id": st.session_state.session_id,
                                 "stream": True
                             },
                             stream=True,
@@ -382,7 +397,7 @@ if query:
                             API_URL,
                             json={
                                 "query": query,
-                                "chat_history": st.session_state.chat_history[:-1],
+                                "session_id": st.session_state.session_id,
                                 "stream": False
                             },
                             timeout=60